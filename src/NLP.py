@@ -1,22 +1,55 @@
-import base64
-import io
+import json
 import os
-from sentence_transformers import SentenceTransformer
+import re
 import numpy as np
 import pandas as pd
 from openai import OpenAI
 from dotenv import load_dotenv
 import cv2
-from PIL import Image, ImageDraw
-from lang_sam import LangSAM
-import pickle
-import textwrap
+from PIL import Image
+from model_registry import registry
+from intent_index import IntentIndex
+from color_engine import ColorIndex
+from filter_cache import FilterCodeCache
+from code_runner import execute_filter_code, runner_stats
+from query_compiler import compile_query
+from segment_table import COLOR_CATEGORIES, build_segment_table, segment_boxes
+from render import draw_boxes, encode_image
+from image_io import bgr_view, load_image
+from sessions import memoize
 
 load_dotenv()
-sentence_model = SentenceTransformer('paraphrase-MiniLM-L6-v2')
 options = os.getenv("OPTIONS").split(",")
+intent_index = IntentIndex(options)
+filter_cache = FilterCodeCache(embed=intent_index.embed_query, slot_words=intent_index.options)
+# Options scoring at least INTENT_MIN_SCORE among the INTENT_TOP_K best are detected together
+INTENT_TOP_K = int(os.getenv("INTENT_TOP_K", "3"))
+INTENT_MIN_SCORE = float(os.getenv("INTENT_MIN_SCORE", "0.4"))
+# Large aerial frames can be detected in overlapping tiles, e.g. DETECT_TILE_SIZE=1024;
+# otherwise images are detected at most DETECT_MAX_SIDE pixels long (0 keeps full size)
+if os.getenv("DETECT_TILE_SIZE"):
+    DETECT_OPTIONS = {
+        "tile_size": int(os.environ["DETECT_TILE_SIZE"]),
+        "tile_overlap": int(os.getenv("DETECT_TILE_OVERLAP", "128")),
+        "tile_batch_size": int(os.getenv("DETECT_TILE_BATCH_SIZE", "4")),
+    }
+else:
+    DETECT_OPTIONS = {"max_side": int(os.getenv("DETECT_MAX_SIDE", "1333")) or None}
 api_key = os.getenv("OPENAI_API_KEY")
 client = OpenAI(api_key=api_key)
+LLM_MODE = os.getenv("LLM_MODE", "single")
+# How each request's filter was produced: local compiler, cached code or a fresh LLM call
+route_stats = {"compiler": 0, "cache": 0, "llm": 0}
+
+
+def pipeline_stats():
+    return {
+        "filter_routes": dict(route_stats),
+        "filter_cache": dict(filter_cache.stats),
+        "filter_exec": runner_stats(),
+        "intent_index": dict(intent_index.stats),
+        "models": dict(registry.stats),
+    }
 
 def output_to_text(query, output):
     if isinstance(output, pd.DataFrame):
@@ -37,257 +70,221 @@ def output_to_text(query, output):
 
     return response.choices[0].message.content
 
-def parse_coordinates(coord):
-    if isinstance(coord, str):
-        return list(map(float, coord.strip("[]").split()))
-    elif isinstance(coord, np.ndarray):
-        return coord.tolist()
-    else:
-        raise ValueError("Unsupported type for coordinates.")
-
-
-def main_predict(image_path, query):
-
-    image = cv2.imread(image_path)
-
-    image_height, image_width, _ = image.shape
+def build_filter_messages(df, query, image_width, image_height, structured=False):
     image_area = image_width * image_height
+    if structured:
+        response_format = """
+            Respond with a JSON object with two keys:
+            - "code": the Python code.
+            - "answer": a short answer to the query (at most 5 words) written as a template, where {count} is replaced by the number of rows in `filtered_data` and {output} by the value of `output_variable` after the code runs.
+        """
+    else:
+        response_format = """
+            Do not include comments, import statements, or library declarations. Write only the Python code.
+        """
 
-    sentence_embedding = sentence_model.encode([query])[0]
-    options_embeddings = sentence_model.encode(options)
-
-    similarities = {}
-    for i, option in enumerate(options):
-        similarity = np.dot(sentence_embedding, options_embeddings[i]) / (np.linalg.norm(sentence_embedding) * np.linalg.norm(options_embeddings[i]))
-        similarities[option] = similarity
-
-    best_option = max(similarities, key=similarities.get)
-
-    print(f"Most Probability world is '{best_option}' with similarity {similarities[best_option]:.4f}")
-
-    def get_filter_code(prompt: str) -> str:
-        response = client.chat.completions.create(
-            model="gpt-4o",
-            messages=prompt,
-            max_tokens=1000,
-            temperature=0,
-        )
-        
-        return response.choices[0].message.content
-
-
-    model_sam = LangSAM()
-    image_pil = Image.open(image_path).convert("RGB")
-    results = model_sam.predict([image_pil], [f"{best_option}."], box_threshold=0.23)
-
-    '''
-    plt.figure(figsize=(10, 10))
-    plt.imshow(image_pil)
-    plt.axis('off')
-
-    for result in results:
-        for i, box in enumerate(result["boxes"]):
-            x_min, y_min, x_max, y_max = box
-            area = (x_max - x_min) * (y_max - y_min) / image_area
-            if area > 0.8:
-                continue
-            plt.gca().add_patch(plt.Rectangle(
-                (x_min, y_min), x_max - x_min, y_max - y_min,
-                edgecolor='red', facecolor='none', linewidth=2
-            ))
-
-    plt.title("Segmentation on Original Image")
-    plt.show()'''
-
-    def calculate_features(points, image):
-        x_min = int(min(p[0] for p in points))
-        x_max = int(max(p[0] for p in points))
-        y_min = int(min(p[1] for p in points))
-        y_max = int(max(p[1] for p in points))
-
-        area = (x_max - x_min) * (y_max - y_min)
-        image_area = image.shape[0] * image.shape[1]
-        relative_area = area / image_area
-        relative_height = (y_max - y_min) / image.shape[0]
-        relative_width = (x_max - x_min) / image.shape[1]
-
-        mean_x = np.mean([p[0] for p in points])
-        mean_y = np.mean([p[1] for p in points])
-
-        cropped_area = image[y_min:y_max, x_min:x_max]
-
-        cropped_hsv = cv2.cvtColor(cropped_area, cv2.COLOR_BGR2HSV)
-
-        color_ranges = {
-            'black':  {'lower': np.array([0, 0, 0]),      'upper': np.array([180, 255, 50])},
-            'white':  {'lower': np.array([0, 0, 200]),    'upper': np.array([180, 30, 255])},
-            'gray':   {'lower': np.array([0, 0, 51]),     'upper': np.array([180, 50, 199])},
-            'red1':   {'lower': np.array([0, 50, 50]),    'upper': np.array([10, 255, 255])},
-            'red2':   {'lower': np.array([160, 50, 50]),  'upper': np.array([180, 255, 255])},
-            'orange': {'lower': np.array([11, 50, 50]),   'upper': np.array([25, 255, 255])},
-            'yellow': {'lower': np.array([26, 50, 50]),   'upper': np.array([34, 255, 255])},
-            'green':  {'lower': np.array([35, 50, 50]),   'upper': np.array([85, 255, 255])},
-            'blue':   {'lower': np.array([100, 150, 50]), 'upper': np.array([115, 255, 200])},
-            'purple': {'lower': np.array([126, 50, 50]),  'upper': np.array([159, 255, 255])}
-        }
-
-        color_counts = {color: 0 for color in color_ranges.keys()}
-        total_pixels = cropped_hsv.shape[0] * cropped_hsv.shape[1]
-
-        for color, bounds in color_ranges.items():
-            mask = cv2.inRange(cropped_hsv, bounds['lower'], bounds['upper'])
-
-            if color == 'blue':
-                kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
-                mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, kernel)
-
-                height = mask.shape[0]
-                reflection_region = int(height * 0.2)
-                spatial_mask = np.zeros_like(mask)
-                spatial_mask[reflection_region:, :] = 255
-                mask = cv2.bitwise_and(mask, mask, mask=spatial_mask)
-
-            count = cv2.countNonZero(mask)
-            color_counts[color] += count
-
-        red_count = color_counts['red1'] + color_counts['red2']
-        color_counts['red'] = red_count
-        del color_counts['red1']
-        del color_counts['red2']
-
-        total_color_pixels = sum(color_counts.values()) - color_counts.get('black', 0) - color_counts.get('white', 0)
-
-        blue_ratio = color_counts['blue'] / total_color_pixels if total_color_pixels > 0 else 0
-
-        if blue_ratio < 0.2:
-            color_counts['blue'] = 0
-
-        dominant_color = max(color_counts, key=color_counts.get)
-        dominant_count = color_counts[dominant_color]
-        dominant_percentage = (dominant_count / total_pixels) * 100
-
-        min_threshold = 10
-
-        if dominant_percentage < min_threshold:
-            color_category = 'other'
-        else:
-            color_category = dominant_color
-
-        return {
-            "coord_1": points[0],
-            "coord_2": points[1],
-            "coord_3": points[2],
-            "coord_4": points[3],
-            "mean_x": mean_x,
-            "mean_y": mean_y,
-            "color": color_category,
-            "area": area,
-            "relative_area": relative_area,
-            "relative_height": relative_height,
-            "relative_width": relative_width
-        }
-
-
-    points_array = np.array([
-        [
-            [row[0], row[1]],
-            [row[2], row[1]],
-            [row[2], row[3]],
-            [row[0], row[3]]
-        ]
-        for row in results[0]['boxes']
-    ])
-
-    dataset = []
-    for points in points_array:
-        features_dict = calculate_features(points, image)
-        dataset.append(features_dict)
-
-    df = pd.DataFrame(dataset)
-
-    tolerance = 10
-
-    messages = [
+    return [
         {"role": "system", "content": "You are an assistant that helps write Python code."},
         {"role": "user", "content": 
         f"""
-            The dataframe contains the following columns: {df.columns}. Image dimensions are {image_width}x{image_height}, and the total area is {image_area}. 
+            The dataframe `df` contains the following columns: {df.columns}. Image dimensions are {image_width}x{image_height}, and the total area is {image_area}. 
+            These values are available as the variables `image_width`, `image_height` and `image_area`; use the variables rather than literal numbers.
             The user's query is: "{query}".
 
+            Each row is one detected object. `x_min`, `y_min`, `x_max`, `y_max` are its bounding box in pixels, `mean_x` and `mean_y` its centre.
+
+            - The `class` column is the detected object type, one of {', '.join(df['class'].cat.categories)}. If the query names an object type, filter on it.
+
             - If the query explicitly mentions a color filter:
-                - Use the `color_category` column to filter rows where the `color_category` matches the specified color name.
-                - For RGB ranges, filter rows where `mean_color_R`, `mean_color_G`, and `mean_color_B` fall within the specified range. If no range is provided, apply a default tolerance of {tolerance} per channel.
+                - Use the `color` column to filter rows where the `color` matches the specified color name. Possible values are {', '.join(COLOR_CATEGORIES)}.
 
             Write Python code based on the query and assign the results as follows:
             - `filtered_data`: A pandas DataFrame containing rows that match the filtering criteria without any aggregation.
             - `output_variable`: The aggregated result if the query requires aggregation.
 
-            Do not include comments, import statements, or library declarations. Write only the Python code.
+            Do not include comments, import statements, or library declarations in the code.
+            {response_format}
         """}
     ]
 
-    filtered_data = None
-    try:
-        filter_code = get_filter_code(prompt=messages).replace("```python", "").replace("```", "").strip()
-        print(filter_code)
-        exec(
-            filter_code +
-            textwrap.dedent(
-                """
-                with open('filtered_data.pkl', 'wb') as f:
-                    pickle.dump(filtered_data, f)
-                
-                with open('output_variable.pkl', 'wb') as f:
-                    pickle.dump(output_variable, f)
-                """
-            )
-        )
 
-        with open("filtered_data.pkl", "rb") as f:
-            filtered_data = pickle.load(f)
+def get_filter_code(messages, structured=False):
+    """Ask GPT-4o for filter code; returns ``{"code": ..., "template": ...}``.
+
+    In structured mode the answer template comes back in the same response,
+    otherwise ``template`` is ``None`` and the answer needs ``output_to_text``.
+    """
+    response = client.chat.completions.create(
+        model="gpt-4o",
+        messages=messages,
+        max_tokens=1000,
+        temperature=0,
+        **({"response_format": {"type": "json_object"}} if structured else {}),
+    )
+    content = response.choices[0].message.content
 
-        
-        with open("output_variable.pkl", "rb") as f:
-            output_variable = pickle.load(f)
+    if structured:
+        payload = json.loads(content)
+        code, template = payload["code"], payload.get("answer")
+    else:
+        code, template = content, None
+    code = code.replace("```python", "").replace("```", "").strip()
+    return {"code": code, "template": template}
 
-        print(output_variable)
-        print(type(output_variable))
 
-        try:
-            original_image = Image.open(image_path)
+class _Placeholders(dict):
+    def __missing__(self, key):
+        return "{" + key + "}"
 
-            highlighted_image = original_image.copy()
-            draw = ImageDraw.Draw(highlighted_image)
 
-            rectangles_image = Image.new("RGB", original_image.size, (0, 0, 0))
+class _Number(float):
+    def __format__(self, spec):
+        if spec:
+            return super().__format__(spec)
+        return f"{self:.2f}".rstrip("0").rstrip(".")
 
-            for _, row in filtered_data.iterrows():
-                rect_coords = [
-                    list(map(float, parse_coordinates(row["coord_1"]))),
-                    list(map(float, parse_coordinates(row["coord_2"]))),
-                    list(map(float, parse_coordinates(row["coord_3"]))),
-                    list(map(float, parse_coordinates(row["coord_4"])))
-                ]
 
-                rect_coords = [tuple(map(int, coord)) for coord in rect_coords]
+def fill_answer_template(template, filtered_data, output_variable):
+    count = len(filtered_data) if hasattr(filtered_data, "__len__") else filtered_data
+    if isinstance(output_variable, (pd.DataFrame, pd.Series)):
+        output = len(output_variable)
+    elif isinstance(output_variable, (float, np.floating)):
+        output = _Number(output_variable)
+    else:
+        output = output_variable
+    try:
+        return template.format_map(_Placeholders(count=count, output=output))
+    except (ValueError, IndexError):
+        return template
+
+
+def match_intents(query, k=INTENT_TOP_K, min_score=INTENT_MIN_SCORE):
+    """The best option plus any other of the top ``k`` scoring at least ``min_score``."""
+    matches = intent_index.top_k(query, k=k)
+    best_option, best_similarity = matches[0]
+    print(f"Most Probability world is '{best_option}' with similarity {best_similarity:.4f}")
+    selected = [best_option] + [option for option, score in matches[1:] if score >= min_score]
+    if len(selected) > 1:
+        print(f"Detecting classes {selected}")
+    return tuple(selected)
+
+
+def _words(text):
+    return set(re.findall(r"\w+", text.lower()))
+
+
+def label_to_option(label, options):
+    """Map a GroundingDINO phrase back to the option it came from.
+
+    The phrase is made of prompt tokens, so the option sharing the most words
+    with it wins; ties go to the better-matching intent, listed first.
+    """
+    words = _words(label)
+    overlap = [len(words & _words(option)) for option in options]
+    return options[int(np.argmax(overlap))]
+
+
+def detect(image, options, sam_type=None):
+    """Detect every option in one GroundingDINO pass; returns ``(boxes, classes)``."""
+    image_pil = Image.fromarray(image)
+    prompt = " ".join(f"{option}." for option in options)
+    with registry.langsam(sam_type) as model_sam:
+        results = model_sam.predict([image_pil], [prompt], box_threshold=0.23, **DETECT_OPTIONS)
+    classes = [label_to_option(label, options) for label in results[0]['labels']]
+    return results[0]['boxes'], classes
+
+
+def resolve_filter(df, query, image_width, image_height, structured):
+    """Filter the segment table for ``query``.
+
+    Returns ``(filtered_data, output_variable, answer_template)``; the template
+    is ``None`` when the answer still has to come from ``output_to_text``.
+    """
+    # Only the classes that were detected are in the table; naming any other makes the query fall back
+    detected_classes = df["class"].cat.categories if "class" in df.columns else ()
+    plan = compile_query(query, detected_classes)
+    if plan is not None:
+        route = "compiler"
+        print(plan)
+        filtered_data, output_variable = plan.run(df, image_width, image_height)
+        answer_template = plan.answer_template() if structured else None
+    else:
+        generated = filter_cache.get(df, query)
+        route = "cache" if generated is not None else "llm"
+        if route == "llm":
+            messages = build_filter_messages(df, query, image_width, image_height, structured)
+            generated = get_filter_code(messages, structured)
+        print(generated["code"])
+        # ``df`` may be the session's memoized table, shared by concurrent questions; the code gets its own copy
+        filtered_data, output_variable = execute_filter_code(generated["code"], {
+            "df": df.copy(),
+            "image_width": image_width,
+            "image_height": image_height,
+            "image_area": image_width * image_height,
+        })
+        if route == "llm":
+            filter_cache.put(df, query, generated)
+        answer_template = generated["template"] if structured else None
+
+    route_stats[route] += 1
+    print(f"Filter served by '{route}'")
+    print(output_variable)
+    print(type(output_variable))
+    return filtered_data, output_variable, answer_template
+
+
+def render_highlight(image, filtered_data, response_mode="image", image_format="png", quality=None):
+    """Base64 image with the filtered boxes drawn on ``image`` (RGB), or in
+    ``"boxes"`` mode the ``[x_min, y_min, x_max, y_max]`` list for the client
+    to draw itself."""
+    boxes = segment_boxes(filtered_data)
+    if response_mode == "boxes":
+        return boxes.tolist()
+    return encode_image(draw_boxes(bgr_view(image), boxes), image_format, quality)
+
+
+def answer_query(query, filtered_data, output_variable, answer_template):
+    if answer_template:
+        return fill_answer_template(answer_template, filtered_data, output_variable)
+    return output_to_text(query, str(output_variable))
+
+
+def main_predict(image, query, sam_type=None, llm_mode=None, response_mode="image", image_format="png",
+                 quality=None, session=None):
+
+    # "single" asks for code and answer template in one call, "two_call" keeps the separate summary call
+    structured = (llm_mode or LLM_MODE) == "single"
+
+    # ``image`` is the decoded RGB array; a path is still accepted for scripts.
+    # With an image ``session`` the stored image, detections and tables are reused.
+    if session is not None:
+        image = session.image
+    elif isinstance(image, str):
+        image = load_image(image)
+
+    image_height, image_width, _ = image.shape
 
-                draw.polygon(rect_coords, outline="red", width=2)
+    selected = match_intents(query)
+    boxes, classes = memoize(session, ("boxes", selected, sam_type), detect, image, selected, sam_type)
 
-                x1, y1 = rect_coords[0]
-                x3, y3 = rect_coords[2]
-                cropped_rectangle = original_image.crop((x1, y1, x3, y3))
+    color_index = memoize(session, "color_index", ColorIndex, image, cv2.COLOR_RGB2HSV)
+    df = memoize(
+        session, ("table", selected, sam_type),
+        lambda: build_segment_table(boxes, image.shape, color_index.classify(boxes), classes, selected),
+    )
 
-                rectangles_image.paste(cropped_rectangle, (x1, y1))
+    try:
+        filtered_data, output_variable, answer_template = resolve_filter(
+            df, query, image_width, image_height, structured
+        )
 
+        try:
+            image_base64 = render_highlight(image, filtered_data, response_mode, image_format, quality)
         except Exception as e:
             print(f"An error occurred while visualizing the results: {e}")
             return None, None
 
-        buffered = io.BytesIO()
-        highlighted_image.save(buffered, format="PNG")
-        image_base64 = base64.b64encode(buffered.getvalue()).decode("utf-8")
-
-        return output_to_text(query, str(output_variable)), image_base64
+        return answer_query(query, filtered_data, output_variable, answer_template), image_base64
     except Exception as e:
         print(f"An error occurred: {e}")
         return None, None
@@ -1,108 +1,319 @@
-import subprocess
+import asyncio
+import json
+import os
+import time
 from flask import Flask, request, jsonify
+from werkzeug.exceptions import RequestEntityTooLarge
 import base64
-from PIL import Image
-from io import BytesIO
-import numpy as np
-import imageio_ffmpeg as ffmpeg
-from transformers import pipeline
-from NLP import main_predict
+from NLP import main_predict, pipeline_stats
+from model_registry import registry
+from pipeline import main_predict_async
+from render import IMAGE_FORMATS, RESPONSE_MODES
+from image_io import decode_image
+from audio import decode_audio
+from transcription import TranscriptionService
+from scheduler import AdmissionController, Overloaded, QueueFull, QueueTimeout
+from sessions import SessionStore
+from streaming import StreamingTranscription, pcm16_to_float
+
+try:
+    from flask_sock import Sock
+except ImportError:
+    Sock = None  # /stream is only served when flask-sock is installed
+
+MAX_IMAGE_BYTES = int(os.getenv("MAX_IMAGE_BYTES", str(20 * 1024 * 1024)))
+MAX_AUDIO_BYTES = int(os.getenv("MAX_AUDIO_BYTES", str(10 * 1024 * 1024)))
 
 app = Flask(__name__)
-whisper_model = pipeline("automatic-speech-recognition", model="openai/whisper-small")
+# Whole bodies beyond this are refused with 413 before being read (Base64 JSON is ~4/3 larger)
+app.config['MAX_CONTENT_LENGTH'] = (MAX_IMAGE_BYTES + MAX_AUDIO_BYTES) * 4 // 3 + 64 * 1024
+# "async" overlaps independent stages of the pipeline and reports their timings
+PIPELINE_MODE = os.getenv("PIPELINE_MODE", "sync")
+transcriber = TranscriptionService()
+admission = AdmissionController()
+sessions = SessionStore()
+STREAM_POLL_SECONDS = 0.05
+# A /stream socket is closed with an error once it has been open this long
+STREAM_MAX_SECONDS = float(os.getenv("STREAM_MAX_SECONDS", "120"))
+
 
+def parse_render_options(data):
+    """Optional output settings: "format" (png, jpeg, webp), "quality" (1-100) and
+    "response" ("image", or "boxes" to get only the box coordinates back)."""
+    render_options = {
+        'response_mode': data.get('response', 'image'),
+        'image_format': data.get('format', 'png').lower(),
+        'quality': data.get('quality'),
+    }
+    if render_options['quality'] is not None:
+        # Form and query-string values arrive as strings
+        try:
+            render_options['quality'] = int(render_options['quality'])
+        except (TypeError, ValueError):
+            return None, f"Invalid quality: {render_options['quality']}"
+    if render_options['response_mode'] not in RESPONSE_MODES:
+        return None, f"Unsupported response mode: {render_options['response_mode']}"
+    if render_options['image_format'] not in IMAGE_FORMATS:
+        return None, f"Unsupported image format: {render_options['image_format']}"
+    return render_options, None
 
-# Function to read and preprocess the audio with ffmpeg via subprocess
-def load_audio_with_ffmpeg(file_path, target_sr=16000):
-    # Get the path of the ffmpeg executable
-    ffmpeg_exe = ffmpeg.get_ffmpeg_exe()
 
-    # ffmpeg command to convert the audio
-    ffmpeg_cmd = [
-        ffmpeg_exe,
-        "-i", file_path,         # Input file
-        "-f", "wav",             # Output format WAV
-        "-ar", str(target_sr),   # Resample to 16 kHz
-        "-ac", "1",              # Mono
-        "pipe:1"                 # Output as binary stream
-    ]
+def predict(image, text, render_options, session=None):
+    result_key = 'boxes' if render_options['response_mode'] == 'boxes' else 'image'
 
-    # Run the command and capture output
     try:
-        process = subprocess.run(
-            ffmpeg_cmd,
-            stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            check=True
-        )
-        # Convert the binary result to a NumPy array
-        wav_data = process.stdout
-        audio = np.frombuffer(wav_data, dtype=np.int16).astype(np.float32) / 32768.0
-        
-        return audio
-    except subprocess.CalledProcessError as e:
-        raise RuntimeError(f"Error with ffmpeg: {e.stderr.decode()}")
+        if PIPELINE_MODE == "async":
+            text, rendered, timings = asyncio.run(
+                main_predict_async(image, text, session=session, **render_options)
+            )
+            return {result_key: rendered, 'text': text, 'timings': timings}
+
+        text, rendered = main_predict(image, text, session=session, **render_options)
+        return {result_key: rendered, 'text': text}
+    finally:
+        if session is not None:
+            # The session may have grown by a detection and a table
+            sessions.trim()
+
+
+def read_limited(stream, limit, name):
+    """Read at most ``limit`` bytes of an upload part, refusing larger ones before decoding."""
+    data = stream.read(limit + 1)
+    if len(data) > limit:
+        raise RequestEntityTooLarge(f'{name} exceeds {limit} bytes')
+    return data
+
+
+def decode_base64_limited(value, limit, name):
+    # Base64 carries 3 bytes per 4 characters, so the size is known before decoding
+    if len(value) * 3 // 4 > limit + 2:
+        raise RequestEntityTooLarge(f'{name} exceeds {limit} bytes')
+    return base64.b64decode(value)
+
+
+def read_upload():
+    """Fields, image bytes and audio bytes of an /upload request.
+
+    Three encodings are accepted: the original JSON body with Base64
+    "image"/"audio", multipart/form-data with "image"/"audio" file parts and
+    the other fields as form values, or a raw image body (Content-Type
+    image/*) with the fields in the query string. Binary parts are read
+    straight from the request stream.
+    """
+    if request.mimetype == 'multipart/form-data':
+        fields = request.form.to_dict()
+        image_part, audio_part = request.files.get('image'), request.files.get('audio')
+        image_data = read_limited(image_part.stream, MAX_IMAGE_BYTES, 'Image') if image_part else None
+        audio_data = read_limited(audio_part.stream, MAX_AUDIO_BYTES, 'Audio') if audio_part else None
+        return fields, image_data, audio_data
+
+    if request.mimetype.startswith('image/'):
+        return request.args.to_dict(), read_limited(request.stream, MAX_IMAGE_BYTES, 'Image'), None
+
+    fields = request.get_json(silent=True)
+    if not fields:
+        return None, None, None
+    image_data = decode_base64_limited(fields['image'], MAX_IMAGE_BYTES, 'Image') if 'image' in fields else None
+    audio_data = decode_base64_limited(fields['audio'], MAX_AUDIO_BYTES, 'Audio') if 'audio' in fields else None
+    return fields, image_data, audio_data
+
+
+def overloaded(error, status):
+    response = jsonify({'error': str(error), 'retry_after': error.retry_after})
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, status
 
 
 @app.route('/upload', methods=['POST'])
 def upload():
     try:
-        data = request.get_json()
-        if not data:
+        try:
+            data, image_data, audio_data = read_upload()
+        except RequestEntityTooLarge as e:
+            return jsonify({'error': e.description}), 413
+        except ValueError as e:
+            return jsonify({'error': f'Invalid upload: {str(e)}'}), 400
+        if not data and image_data is None:
             return jsonify({'error': 'Data required'}), 400
 
-        has_image = 'image' in data
-        has_audio = 'audio' in data
-
-        if has_image:
-            image_b64 = data['image']
-            try:
-                # Decode the Base64 image
-                image_data = base64.b64decode(image_b64)
-
-                # Validate the image using PIL
-                image = Image.open(BytesIO(image_data))
-                image.verify()  # Verify image integrity
-                print("Image verified successfully!")
-
-                # Optionally save and reopen for re-encoding
-                image = Image.open(BytesIO(image_data))
-                buffer = BytesIO()
-                image.save(buffer, format="PNG")
-                buffer.seek(0)
+        # A registered image is referenced by "image_id" instead of being sent again
+        session = None
+        if image_data is None and data.get('image_id'):
+            session = sessions.get(data['image_id'])
+            if session is None:
+                return jsonify({'error': 'Unknown or expired image_id'}), 404
+        elif image_data is None:
+            return jsonify({'error': 'Image required'}), 400
+        if audio_data is None and 'text' not in data:
+            return jsonify({'error': 'Text or audio required'}), 400
 
-                # save the image on the disk
-                image.save('image.jpg')
+        render_options, error = parse_render_options(data)
+        if error:
+            return jsonify({'error': error}), 400
 
+        image = None
+        if session is None:
+            try:
+                # Decode the image once; the RGB array is shared by every stage
+                image = decode_image(image_data)
             except Exception as e:
                 return jsonify({'error': f'Invalid image file: {str(e)}'}), 400
 
-        if has_audio:
-            audio_b64 = data['audio']
+        if audio_data is not None:
             try:
-                audio_data = base64.b64decode(audio_b64)
-
-                # Write the audio data to a file
-                with open('audio.wav', 'wb') as audio_file:
-                    audio_file.write(audio_data)
+                # Decode and resample to 16 kHz mono in memory
+                audio_final = decode_audio(audio_data)
 
-                # Preprocess the audio file
-                audio_final = load_audio_with_ffmpeg('audio.wav')
-
-                # Use Whisper to transcribe
-                result = whisper_model(audio_final)
-                text = result['text']
+                # Transcribed before taking an inference slot, so concurrent clips
+                # can share a Whisper micro-batch beyond INFERENCE_CONCURRENCY
+                text = transcriber.transcribe(audio_final)
             except Exception as e:
                 return jsonify({'error': f'Error occurred while processing audio file: {str(e)}'}), 500
         else:
-          text = data['text']
-            
-        text, image_base64 = main_predict('image.jpg', text)
+            text = data['text']
+
+        # The slot covers detection and filtering only; refused fast when the queue is full
+        with admission.admit():
+            result = predict(image, text, render_options, session)
+        return jsonify(result), 200
+    except QueueFull as e:
+        return overloaded(e, 429)
+    except QueueTimeout as e:
+        return overloaded(e, 503)
+    except Exception as e:
+        return jsonify({'error': f'Internal server error: {str(e)}'}), 500
+
 
-        return jsonify({'image': image_base64, 'text': text}), 200
+@app.route('/session', methods=['POST'])
+def create_session():
+    """Register an image (same encodings as /upload) for follow-up questions.
+
+    Returns {"image_id"}; /upload and /stream accept it in place of the image
+    and reuse its decoded pixels, detections and segment tables until the
+    session has been idle for SESSION_TTL_SECONDS.
+    """
+    try:
+        try:
+            _, image_data, _ = read_upload()
+        except RequestEntityTooLarge as e:
+            return jsonify({'error': e.description}), 413
+        except ValueError as e:
+            return jsonify({'error': f'Invalid upload: {str(e)}'}), 400
+        if image_data is None:
+            return jsonify({'error': 'Image required'}), 400
+
+        try:
+            image = decode_image(image_data)
+        except Exception as e:
+            return jsonify({'error': f'Invalid image file: {str(e)}'}), 400
+
+        return jsonify({'image_id': sessions.create(image), 'ttl': sessions.ttl}), 200
     except Exception as e:
         return jsonify({'error': f'Internal server error: {str(e)}'}), 500
 
 
+@app.route('/session/<image_id>', methods=['DELETE'])
+def delete_session(image_id):
+    if not sessions.delete(image_id):
+        return jsonify({'error': 'Unknown or expired image_id'}), 404
+    return jsonify({'image_id': image_id}), 200
+
+
+if Sock is not None:
+    # Frames larger than an upload body are refused by the WebSocket server before being buffered
+    app.config['SOCK_SERVER_OPTIONS'] = {'max_message_size': app.config['MAX_CONTENT_LENGTH']}
+    sock = Sock(app)
+
+    @sock.route('/stream')
+    def stream(ws):
+        """Voice queries streamed while the user speaks.
+
+        Protocol: a JSON text message with "image" (Base64) or "image_id" and
+        the optional render settings of /upload, binary messages of 16 kHz mono 16-bit PCM,
+        then {"event": "end"}. The server answers {"type": "partial", "text"}
+        as windows are transcribed and a final {"type": "result", ...} with the
+        same fields as /upload plus "query", the full transcript.
+
+        The image and the audio are held to MAX_IMAGE_BYTES and MAX_AUDIO_BYTES
+        as in /upload, and the whole stream to STREAM_MAX_SECONDS.
+        """
+        transcription = StreamingTranscription(transcriber)
+        image, session, render_options = None, None, None
+        audio_bytes = 0
+        deadline = time.monotonic() + STREAM_MAX_SECONDS
+        while True:
+            if time.monotonic() > deadline:
+                ws.send(json.dumps({'type': 'error', 'error': f'Stream exceeds {STREAM_MAX_SECONDS:g} seconds'}))
+                return
+            message = ws.receive(timeout=STREAM_POLL_SECONDS)
+            if isinstance(message, (bytes, bytearray)):
+                audio_bytes += len(message)
+                if audio_bytes > MAX_AUDIO_BYTES:
+                    ws.send(json.dumps({'type': 'error', 'error': f'Audio exceeds {MAX_AUDIO_BYTES} bytes'}))
+                    return
+                try:
+                    samples = pcm16_to_float(message)
+                except ValueError as e:
+                    ws.send(json.dumps({'type': 'error', 'error': f'Invalid audio frame: {str(e)}'}))
+                    return
+                transcription.feed(samples)
+            elif message is not None:
+                try:
+                    data = json.loads(message)
+                    if not isinstance(data, dict):
+                        raise ValueError('expected a JSON object')
+                    if 'image' in data or 'image_id' in data:
+                        if 'image' in data:
+                            image = decode_image(decode_base64_limited(data['image'], MAX_IMAGE_BYTES, 'Image'))
+                        else:
+                            session = sessions.get(data['image_id'])
+                            if session is None:
+                                ws.send(json.dumps({'type': 'error', 'error': 'Unknown or expired image_id'}))
+                                return
+                        render_options, error = parse_render_options(data)
+                        if error:
+                            ws.send(json.dumps({'type': 'error', 'error': error}))
+                            return
+                except RequestEntityTooLarge as e:
+                    ws.send(json.dumps({'type': 'error', 'error': e.description}))
+                    return
+                except Exception as e:
+                    ws.send(json.dumps({'type': 'error', 'error': f'Invalid message: {str(e)}'}))
+                    return
+                if data.get('event') == 'end':
+                    break
+
+            partial = transcription.poll()
+            if partial is not None:
+                ws.send(json.dumps({'type': 'partial', 'text': partial}))
+
+        if image is None and session is None:
+            ws.send(json.dumps({'type': 'error', 'error': 'Image required'}))
+            return
+        try:
+            query = transcription.finish()
+            with admission.admit():
+                result = predict(image, query, render_options, session)
+        except Overloaded as e:
+            ws.send(json.dumps({'type': 'error', 'error': str(e), 'retry_after': e.retry_after}))
+            return
+        except Exception as e:
+            ws.send(json.dumps({'type': 'error', 'error': f'Internal server error: {str(e)}'}))
+            return
+        ws.send(json.dumps({'type': 'result', 'query': query, **result}))
+
+
+@app.route('/stats', methods=['GET'])
+def stats():
+    return jsonify({
+        **pipeline_stats(),
+        'transcription': transcriber.stats(),
+        'admission': admission.stats(),
+        'sessions': sessions.stats(),
+    }), 200
+
+
 if __name__ == "__main__":
+    # Build the models before accepting requests so the first upload is warm
+    registry.preload(os.getenv("PRELOAD_MODELS", "sentence,whisper,langsam").split(","))
     app.run(host="0.0.0.0", port=80)
\ No newline at end of file
@@ -0,0 +1,153 @@
+import io
+import os
+import subprocess
+import tempfile
+import threading
+import wave
+
+import numpy as np
+
+TARGET_SR = 16000
+PCM_DTYPES = {1: np.uint8, 2: np.int16, 4: np.int32}
+
+try:
+    import av
+except ImportError:
+    av = None
+
+
+def resample(audio, orig_sr, target_sr=TARGET_SR):
+    """Resample mono float audio; a windowed-sinc low-pass runs first when downsampling."""
+    if orig_sr == target_sr or not len(audio):
+        return audio.astype(np.float32, copy=False)
+    if target_sr < orig_sr:
+        cutoff = 0.5 * target_sr / orig_sr
+        taps = np.arange(-64, 65)
+        kernel = 2 * cutoff * np.sinc(2 * cutoff * taps) * np.hanning(len(taps))
+        audio = np.convolve(audio, kernel / kernel.sum(), mode="same")
+    duration = len(audio) / orig_sr
+    positions = np.arange(int(duration * target_sr)) * (orig_sr / target_sr)
+    return np.interp(positions, np.arange(len(audio)), audio).astype(np.float32)
+
+
+def decode_wav(data, target_sr=TARGET_SR):
+    """Decode PCM WAV bytes with the standard library, or return ``None`` for anything else."""
+    try:
+        with wave.open(io.BytesIO(data)) as wav:
+            channels, width, sr = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            frames = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError):
+        return None
+    if width not in PCM_DTYPES:
+        return None
+
+    samples = np.frombuffer(frames, dtype=PCM_DTYPES[width])
+    if width == 1:
+        audio = (samples.astype(np.float32) - 128) / 128.0
+    else:
+        audio = samples.astype(np.float32) / float(np.iinfo(PCM_DTYPES[width]).max + 1)
+    if channels > 1:
+        audio = audio.reshape(-1, channels).mean(axis=1)
+    # 16 kHz mono PCM, what the Flutter recorder sends, needs no resampling
+    return resample(audio, sr, target_sr)
+
+
+def decode_with_av(data, target_sr=TARGET_SR):
+    resampler = av.AudioResampler(format="flt", layout="mono", rate=target_sr)
+    chunks = []
+    with av.open(io.BytesIO(data)) as container:
+        for frame in container.decode(audio=0):
+            for resampled in resampler.resample(frame):
+                chunks.append(resampled.to_ndarray().reshape(-1))
+    for resampled in resampler.resample(None):
+        chunks.append(resampled.to_ndarray().reshape(-1))
+    return np.concatenate(chunks).astype(np.float32) if chunks else np.zeros(0, dtype=np.float32)
+
+
+class FFmpegDecoder:
+    """ffmpeg fallback that keeps a spare process already started.
+
+    Each ffmpeg process can only decode one input, so the next one is
+    launched in the background as soon as the current one is taken, keeping
+    the process start-up off the request path. Input goes through stdin;
+    containers that need seeking (e.g. MP4 with a trailing moov atom) are
+    retried from a private temporary file.
+    """
+
+    def __init__(self, target_sr=TARGET_SR):
+        self.target_sr = target_sr
+        self._spare = None
+        self._lock = threading.Lock()
+
+    def _command(self, source):
+        import imageio_ffmpeg
+
+        return [
+            imageio_ffmpeg.get_ffmpeg_exe(), "-loglevel", "error",
+            "-i", source,
+            "-f", "s16le", "-acodec", "pcm_s16le",
+            "-ar", str(self.target_sr), "-ac", "1",
+            "pipe:1",
+        ]
+
+    def _spawn(self):
+        return subprocess.Popen(
+            self._command("pipe:0"), stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE
+        )
+
+    def _refill(self):
+        process = self._spawn()
+        with self._lock:
+            if self._spare is None:
+                self._spare = process
+                return
+        process.kill()
+        process.wait()
+
+    def _take(self):
+        with self._lock:
+            process, self._spare = self._spare, None
+        threading.Thread(target=self._refill, daemon=True).start()
+        return process if process is not None and process.poll() is None else self._spawn()
+
+    def _to_audio(self, stdout):
+        return np.frombuffer(stdout, dtype=np.int16).astype(np.float32) / 32768.0
+
+    def decode(self, data):
+        process = self._take()
+        stdout, stderr = process.communicate(data)
+        if process.returncode == 0 and stdout:
+            return self._to_audio(stdout)
+
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(data)
+            result = subprocess.run(self._command(path), stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+        finally:
+            os.remove(path)
+        if result.returncode != 0:
+            raise RuntimeError(f"Error with ffmpeg: {result.stderr.decode() or stderr.decode()}")
+        return self._to_audio(result.stdout)
+
+
+ffmpeg_decoder = FFmpegDecoder()
+
+
+def decode_audio(data, target_sr=TARGET_SR):
+    """Decode uploaded audio bytes to mono float32 samples at ``target_sr``.
+
+    PCM WAV is decoded in-process with no codec library; other formats go
+    through PyAV when it is installed, and through ffmpeg otherwise.
+    """
+    audio = decode_wav(data, target_sr)
+    if audio is not None:
+        return audio
+    if av is not None:
+        try:
+            return decode_with_av(data, target_sr)
+        except Exception as e:  # PyAV raises a different error type per FFmpeg failure
+            print(f"PyAV could not decode the audio, falling back to ffmpeg: {e}")
+    if target_sr != ffmpeg_decoder.target_sr:
+        return FFmpegDecoder(target_sr).decode(data)
+    return ffmpeg_decoder.decode(data)
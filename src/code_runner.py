@@ -0,0 +1,166 @@
+import multiprocessing
+import os
+import queue
+import threading
+
+import numpy as np
+import pandas as pd
+
+FILTER_EXEC_TIMEOUT = float(os.getenv("FILTER_EXEC_TIMEOUT", "5"))
+# N > 0 runs the code in a pool of N worker processes, which are killed and replaced on timeout;
+# 0 runs it in a thread of the calling process, where a runaway snippet cannot be stopped
+FILTER_EXEC_WORKERS = int(os.getenv("FILTER_EXEC_WORKERS", "2"))
+
+
+class FilterCodeError(RuntimeError):
+    pass
+
+
+class FilterCodeTimeout(FilterCodeError, TimeoutError):
+    pass
+
+
+# Threads abandoned on timeout; they keep competing for the GIL until the code ends on its own
+_orphans = []
+_orphans_lock = threading.Lock()
+_stats = {"thread_timeouts": 0, "worker_restarts": 0}
+
+
+def run_filter_code(code, variables):
+    """Execute ``code`` in a fresh namespace holding ``pd``, ``np`` and ``variables``.
+
+    Returns ``(filtered_data, output_variable)``; ``output_variable`` falls back
+    to ``filtered_data`` when the code does not aggregate.
+    """
+    namespace = {"pd": pd, "np": np, **variables}
+    exec(code, namespace)
+    if "filtered_data" not in namespace:
+        raise FilterCodeError("The generated code did not assign filtered_data")
+    filtered_data = namespace["filtered_data"]
+    return filtered_data, namespace.get("output_variable", filtered_data)
+
+
+def orphaned_threads():
+    """Number of timed-out filter threads that are still running."""
+    with _orphans_lock:
+        _orphans[:] = [thread for thread in _orphans if thread.is_alive()]
+        return len(_orphans)
+
+
+def _run_in_thread(code, variables, timeout):
+    outcome = {}
+
+    def target():
+        try:
+            outcome["result"] = run_filter_code(code, variables)
+        except BaseException as e:
+            outcome["error"] = e
+
+    # A thread cannot be killed: on timeout it is abandoned and keeps running
+    # in the background. Use the worker pool when that is not acceptable.
+    thread = threading.Thread(target=target, daemon=True)
+    thread.start()
+    thread.join(timeout)
+    if thread.is_alive():
+        with _orphans_lock:
+            _orphans.append(thread)
+        _stats["thread_timeouts"] += 1
+        print(
+            f"WARNING: generated filter code timed out after {timeout}s and keeps running in a thread "
+            f"({orphaned_threads()} still running); set FILTER_EXEC_WORKERS > 0 to kill runaway code"
+        )
+        raise FilterCodeTimeout(f"The generated code did not finish within {timeout}s")
+    if "error" in outcome:
+        raise outcome["error"]
+    return outcome["result"]
+
+
+def _worker_main(conn):
+    while True:
+        try:
+            code, variables = conn.recv()
+        except (EOFError, OSError):
+            return
+        try:
+            conn.send(("ok", run_filter_code(code, variables)))
+        except Exception as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+class FilterWorkerPool:
+    """Pre-started worker processes that run generated code one job at a time.
+
+    A worker that times out or dies is killed and replaced, so a runaway or
+    crashing snippet never takes the server down with it.
+    """
+
+    def __init__(self, size, timeout=FILTER_EXEC_TIMEOUT):
+        methods = multiprocessing.get_all_start_methods()
+        # forkserver workers start from a clean process instead of a copy of the loaded models
+        self._context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        self.timeout = timeout
+        self._idle = queue.Queue()
+        for _ in range(size):
+            self._idle.put(self._spawn())
+
+    def _spawn(self):
+        parent_conn, child_conn = self._context.Pipe()
+        process = self._context.Process(target=_worker_main, args=(child_conn,), daemon=True)
+        process.start()
+        child_conn.close()
+        return process, parent_conn
+
+    def _replace(self, worker):
+        _stats["worker_restarts"] += 1
+        process, conn = worker
+        process.kill()
+        process.join()
+        conn.close()
+        return self._spawn()
+
+    def run(self, code, variables, timeout=None):
+        timeout = self.timeout if timeout is None else timeout
+        worker = self._idle.get()
+        status, error = None, None
+        try:
+            process, conn = worker
+            conn.send((code, variables))
+            if conn.poll(timeout):
+                status, payload = conn.recv()
+            else:
+                error = FilterCodeTimeout(f"The generated code did not finish within {timeout}s")
+        except (EOFError, OSError) as e:
+            error = FilterCodeError(f"Filter worker died: {e}")
+        finally:
+            if status is None:
+                worker = self._replace(worker)
+            self._idle.put(worker)
+
+        if error is not None:
+            raise error
+        if status == "error":
+            raise FilterCodeError(payload)
+        return payload
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def execute_filter_code(code, variables, timeout=FILTER_EXEC_TIMEOUT, workers=FILTER_EXEC_WORKERS):
+    """Run generated filter code with a wall-clock limit and return its results in memory."""
+    global _pool
+    if workers <= 0:
+        return _run_in_thread(code, variables, timeout)
+    with _pool_lock:
+        if _pool is None:
+            _pool = FilterWorkerPool(workers, timeout)
+    return _pool.run(code, variables, timeout)
+
+
+def runner_stats():
+    return {
+        **_stats,
+        "mode": "processes" if FILTER_EXEC_WORKERS > 0 else "threads",
+        "orphaned_threads": orphaned_threads(),
+    }
@@ -0,0 +1,143 @@
+import cv2
+import numpy as np
+
+# HSV ranges in OpenCV units (H in [0, 180], S and V in [0, 255]).
+COLOR_RANGES = {
+    'black':  {'lower': np.array([0, 0, 0]),      'upper': np.array([180, 255, 50])},
+    'white':  {'lower': np.array([0, 0, 200]),    'upper': np.array([180, 30, 255])},
+    'gray':   {'lower': np.array([0, 0, 51]),     'upper': np.array([180, 50, 199])},
+    'red1':   {'lower': np.array([0, 50, 50]),    'upper': np.array([10, 255, 255])},
+    'red2':   {'lower': np.array([160, 50, 50]),  'upper': np.array([180, 255, 255])},
+    'orange': {'lower': np.array([11, 50, 50]),   'upper': np.array([25, 255, 255])},
+    'yellow': {'lower': np.array([26, 50, 50]),   'upper': np.array([34, 255, 255])},
+    'green':  {'lower': np.array([35, 50, 50]),   'upper': np.array([85, 255, 255])},
+    'blue':   {'lower': np.array([100, 150, 50]), 'upper': np.array([115, 255, 200])},
+    'purple': {'lower': np.array([126, 50, 50]),  'upper': np.array([159, 255, 255])}
+}
+
+# Order used to break ties for the dominant color (red1/red2 are merged last).
+COLORS = ['black', 'white', 'gray', 'orange', 'yellow', 'green', 'blue', 'purple', 'red']
+OTHER = 'other'
+
+BLUE_MIN_RATIO = 0.2
+BLUE_REFLECTION_RATIO = 0.2
+MIN_DOMINANT_PERCENTAGE = 10
+
+
+def _build_luts():
+    """Per-channel bit tables: a pixel is in color ``i`` iff bit ``i`` is set in
+    ``lut_h[h] & lut_s[s] & lut_v[v]``. The ranges can overlap, so a pixel may
+    carry several bits, exactly as with one ``cv2.inRange`` per color.
+
+    red1 and red2 only differ in hue and share their S/V bounds, so they can
+    share the ``red`` bit without changing the merged count."""
+    luts = np.zeros((3, 256), dtype=np.uint16)
+    values = np.arange(256)
+    for name, bounds in COLOR_RANGES.items():
+        bit = np.uint16(1 << COLORS.index('red' if name.startswith('red') else name))
+        for channel in range(3):
+            inside = (values >= bounds['lower'][channel]) & (values <= bounds['upper'][channel])
+            luts[channel, inside] |= bit
+    return luts
+
+
+HSV_LUTS = _build_luts()
+
+
+# Bits of every possible label value, so a label histogram turns into per-color counts
+LABEL_BITS = ((np.arange(1 << len(COLORS))[:, None] >> np.arange(len(COLORS))) & 1).astype(np.int64)
+
+
+class ColorIndex:
+    """Per-pixel color labels for one image, stored as a single uint16 array.
+
+    The image is converted to HSV and labelled once. Boxes are counted with
+    a label histogram per crop while together they cover less than the image;
+    denser scenes use one temporary integral image per color instead, so each
+    box costs four lookups. Blue is opened with a 5x5 ellipse over the whole
+    image rather than per crop, so blue counts can differ from a per-crop
+    opening within 2 px of a box edge.
+    """
+
+    def __init__(self, image, conversion=cv2.COLOR_BGR2HSV):
+        hsv = cv2.cvtColor(image, conversion)
+        labels = HSV_LUTS[0][hsv[..., 0]] & HSV_LUTS[1][hsv[..., 1]] & HSV_LUTS[2][hsv[..., 2]]
+
+        blue_bit = COLORS.index('blue')
+        blue = ((labels >> blue_bit) & 1).astype(np.uint8)
+        kernel = cv2.getStructuringElement(cv2.MORPH_ELLIPSE, (5, 5))
+        blue = cv2.morphologyEx(blue, cv2.MORPH_OPEN, kernel)
+        labels &= np.uint16(~(1 << blue_bit) & 0xFFFF)
+        labels |= blue.astype(np.uint16) << np.uint16(blue_bit)
+
+        self.labels = labels
+        self.shape = labels.shape
+
+    @property
+    def nbytes(self):
+        return self.labels.nbytes
+
+    def _histogram_counts(self, x0, y0, x1, y1, blue_y0):
+        blue = COLORS.index('blue')
+        counts = np.zeros((len(x0), len(COLORS)), dtype=np.int64)
+        for i in range(len(x0)):
+            crop = self.labels[y0[i]:y1[i], x0[i]:x1[i]]
+            counts[i] = np.bincount(crop.ravel(), minlength=len(LABEL_BITS)) @ LABEL_BITS
+            blue_crop = crop[blue_y0[i] - y0[i]:]
+            counts[i, blue] = np.count_nonzero(blue_crop & np.uint16(1 << blue))
+        return counts
+
+    def _integral_counts(self, x0, y0, x1, y1, blue_y0):
+        counts = np.zeros((len(x0), len(COLORS)), dtype=np.int64)
+        for i, color in enumerate(COLORS):
+            mask = ((self.labels >> i) & 1).astype(np.uint8)
+            if not mask.any():
+                continue
+            # One color at a time, so only a single int32 integral is alive
+            integral = cv2.integral(mask)
+            top = blue_y0 if color == 'blue' else y0
+            counts[:, i] = integral[y1, x1] - integral[top, x1] - integral[y1, x0] + integral[top, x0]
+        return counts
+
+    def counts(self, boxes):
+        """Pixel counts per color for ``xyxy`` boxes, shape ``(N, len(COLORS))``."""
+        height, width = self.shape
+        boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+        x0 = np.clip(boxes[:, 0].astype(np.int64), 0, width)
+        y0 = np.clip(boxes[:, 1].astype(np.int64), 0, height)
+        x1 = np.clip(boxes[:, 2].astype(np.int64), x0, width)
+        y1 = np.clip(boxes[:, 3].astype(np.int64), y0, height)
+        # Blue ignores the top of each box, where reflections sit
+        blue_y0 = y0 + ((y1 - y0) * BLUE_REFLECTION_RATIO).astype(np.int64)
+
+        areas = (x1 - x0) * (y1 - y0)
+        if areas.sum() < height * width:
+            counts = self._histogram_counts(x0, y0, x1, y1, blue_y0)
+        else:
+            counts = self._integral_counts(x0, y0, x1, y1, blue_y0)
+        return counts, areas
+
+    def classify(self, boxes):
+        """Dominant color name (or ``'other'``) for each ``xyxy`` box."""
+        counts, total_pixels = self.counts(boxes)
+        if not len(counts):
+            return []
+
+        black, white, blue = (COLORS.index(c) for c in ('black', 'white', 'blue'))
+        total_color_pixels = counts.sum(axis=1) - counts[:, black] - counts[:, white]
+        blue_ratio = np.divide(
+            counts[:, blue], total_color_pixels,
+            out=np.zeros(len(counts)), where=total_color_pixels > 0,
+        )
+        counts[blue_ratio < BLUE_MIN_RATIO, blue] = 0
+
+        dominant = counts.argmax(axis=1)
+        dominant_count = counts[np.arange(len(counts)), dominant]
+        dominant_percentage = np.divide(
+            dominant_count * 100.0, total_pixels,
+            out=np.zeros(len(counts)), where=total_pixels > 0,
+        )
+        return [
+            COLORS[d] if percentage >= MIN_DOMINANT_PERCENTAGE else OTHER
+            for d, percentage in zip(dominant, dominant_percentage)
+        ]
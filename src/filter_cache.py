@@ -0,0 +1,140 @@
+import hashlib
+import json
+import os
+import re
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+FILTER_CACHE_SIZE = int(os.getenv("FILTER_CACHE_SIZE", "512"))
+FILTER_CACHE_THRESHOLD = float(os.getenv("FILTER_CACHE_THRESHOLD", "0.95"))
+FILTER_CACHE_PATH = os.getenv("FILTER_CACHE_PATH")
+
+# Words that change the generated code even when the rest of the sentence is
+# a paraphrase ("red cars" vs "blue cars" embed almost identically).
+SLOT_WORDS = {
+    "black", "white", "gray", "grey", "red", "orange", "yellow", "green", "blue", "purple", "other",
+    "left", "right", "top", "bottom", "upper", "lower", "center", "centre", "middle",
+    "largest", "biggest", "smallest", "tiniest", "large", "big", "small", "tiny",
+    "most", "least", "more", "less", "than", "not", "no", "without", "except",
+    "first", "last", "half", "quarter", "percent",
+}
+
+
+def normalize_query(query):
+    return " ".join(re.findall(r"[a-z0-9]+", query.lower()))
+
+
+def query_slots(query, extra_words=()):
+    words = normalize_query(query).split()
+    extra_words = {word.strip().lower() for word in extra_words}
+    vocabulary = SLOT_WORDS | extra_words | {f"{word}s" for word in extra_words} | {f"{word}es" for word in extra_words}
+    return sorted({word for word in words if word in vocabulary or word.isdigit()})
+
+
+def schema_key(df):
+    schema = [[str(column), str(dtype)] for column, dtype in df.dtypes.items()]
+    return hashlib.sha256(json.dumps(schema).encode("utf-8")).hexdigest()[:16]
+
+
+class FilterCodeCache:
+    """LRU cache of generated filter code keyed by dataframe schema and query.
+
+    A lookup first tries the normalized query text, then the closest cached
+    query with the same schema whose embedding similarity reaches
+    ``threshold`` and whose slot words (colors, positions, sizes, numbers,
+    class names) are identical.
+    """
+
+    def __init__(self, embed=None, threshold=FILTER_CACHE_THRESHOLD, max_entries=FILTER_CACHE_SIZE,
+                 path=FILTER_CACHE_PATH, slot_words=()):
+        self.embed = embed
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.path = path
+        self.slot_words = tuple(slot_words)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0}
+        if path and os.path.exists(path):
+            self._load()
+
+    def _key(self, df, query):
+        return f"{schema_key(df)}:{normalize_query(query)}"
+
+    def _embedding(self, query):
+        if self.embed is None:
+            return None
+        return np.asarray(self.embed(query), dtype=np.float32)
+
+    def get(self, df, query):
+        key = self._key(df, query)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.stats["exact_hits"] += 1
+                return entry["value"]
+
+        embedding = self._embedding(query)
+        if embedding is not None:
+            schema = schema_key(df)
+            slots = query_slots(query, self.slot_words)
+            with self._lock:
+                candidates = [
+                    (candidate_key, entry) for candidate_key, entry in self._entries.items()
+                    if entry["schema"] == schema and entry["slots"] == slots and entry["embedding"] is not None
+                ]
+                if candidates:
+                    scores = np.stack([entry["embedding"] for _, entry in candidates]) @ embedding
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        candidate_key, entry = candidates[best]
+                        self._entries.move_to_end(candidate_key)
+                        self.stats["semantic_hits"] += 1
+                        return entry["value"]
+
+        with self._lock:
+            self.stats["misses"] += 1
+        return None
+
+    def put(self, df, query, value):
+        entry = {
+            "schema": schema_key(df),
+            "slots": query_slots(query, self.slot_words),
+            "embedding": self._embedding(query),
+            "value": value,
+        }
+        with self._lock:
+            self._entries[self._key(df, query)] = entry
+            self._entries.move_to_end(self._key(df, query))
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            if self.path:
+                self._save()
+
+    def _save(self):
+        entries = [
+            [key, {**entry, "embedding": None if entry["embedding"] is None else entry["embedding"].tolist()}]
+            for key, entry in self._entries.items()
+        ]
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(entries, f)
+        os.replace(tmp_path, self.path)
+
+    def _load(self):
+        try:
+            with open(self.path) as f:
+                entries = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Could not load filter cache from {self.path}: {e}")
+            return
+        for key, entry in entries[-self.max_entries:]:
+            if entry["embedding"] is not None:
+                entry["embedding"] = np.asarray(entry["embedding"], dtype=np.float32)
+            self._entries[key] = entry
@@ -0,0 +1,20 @@
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+
+def decode_image(image_data):
+    """Decode encoded image bytes into an RGB ``uint8`` array (H, W, 3)."""
+    with Image.open(BytesIO(image_data)) as image:
+        return np.asarray(image.convert("RGB"))
+
+
+def load_image(image_path):
+    with open(image_path, "rb") as f:
+        return decode_image(f.read())
+
+
+def bgr_view(image_rgb):
+    """Zero-copy BGR view of an RGB array for OpenCV calls that expect BGR."""
+    return image_rgb[..., ::-1]
@@ -0,0 +1,101 @@
+import hashlib
+import json
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+from model_registry import SENTENCE_MODEL_NAME, registry
+
+INTENT_CACHE_DIR = os.getenv("INTENT_CACHE_DIR", os.path.join(".cache", "intent_index"))
+QUERY_CACHE_SIZE = int(os.getenv("INTENT_QUERY_CACHE_SIZE", "1024"))
+
+
+def normalize_query(query):
+    return " ".join(query.lower().split())
+
+
+def _normalize_rows(matrix):
+    matrix = np.asarray(matrix, dtype=np.float32)
+    norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+    return matrix / np.maximum(norms, 1e-12)
+
+
+class IntentIndex:
+    """Unit-norm SBERT embeddings of the OPTIONS labels.
+
+    The matrix is built once, saved under ``cache_dir`` with a name derived from
+    the model name and the options, and reloaded on restart. Query embeddings
+    are kept in a small LRU so repeated phrasings never reach SBERT.
+    """
+
+    def __init__(self, options, model_name=None, cache_dir=INTENT_CACHE_DIR, query_cache_size=QUERY_CACHE_SIZE):
+        self.options = [option.strip() for option in options]
+        self.model_name = model_name or SENTENCE_MODEL_NAME
+        self.cache_dir = cache_dir
+        self.query_cache_size = query_cache_size
+        self._embeddings = None
+        self._queries = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"query_hits": 0, "query_misses": 0}
+
+    @property
+    def key(self):
+        payload = json.dumps([self.model_name, self.options]).encode("utf-8")
+        return hashlib.sha256(payload).hexdigest()[:16]
+
+    @property
+    def path(self):
+        return os.path.join(self.cache_dir, f"{self.key}.npy")
+
+    @property
+    def embeddings(self):
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    self._embeddings = self._load_or_build()
+        return self._embeddings
+
+    def _encode(self, texts):
+        with registry.sentence_model(self.model_name) as sentence_model:
+            return _normalize_rows(sentence_model.encode(texts))
+
+    def _load_or_build(self):
+        if os.path.exists(self.path):
+            embeddings = np.load(self.path)
+            if embeddings.shape[0] == len(self.options):
+                return embeddings
+
+        embeddings = self._encode(self.options)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, embeddings)
+        os.replace(tmp_path, self.path)
+        return embeddings
+
+    def embed_query(self, query):
+        key = normalize_query(query)
+        with self._lock:
+            embedding = self._queries.get(key)
+            if embedding is not None:
+                self._queries.move_to_end(key)
+                self.stats["query_hits"] += 1
+                return embedding
+            self.stats["query_misses"] += 1
+
+        embedding = self._encode([key])[0]
+        with self._lock:
+            self._queries[key] = embedding
+            while len(self._queries) > self.query_cache_size:
+                self._queries.popitem(last=False)
+        return embedding
+
+    def top_k(self, query, k=1):
+        """Return the ``k`` best ``(label, cosine similarity)`` pairs for ``query``."""
+        scores = self.embeddings @ self.embed_query(query)
+        k = min(k, len(scores))
+        best = np.argpartition(-scores, k - 1)[:k]
+        best = best[np.argsort(-scores[best])]
+        return [(self.options[i], float(scores[i])) for i in best]
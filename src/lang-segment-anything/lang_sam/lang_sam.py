@@ -1,17 +1,33 @@
 import numpy as np
 from PIL import Image
 
+from lang_sam.masks import LazyMasks, PackedMasks
 from lang_sam.models.gdino import GDINO
 from lang_sam.models.sam import SAM
+from lang_sam.tiling import drop_seam_boxes, mask_windows, merge_boxes, tile_grid
 
 
 class LangSAM:
-    def __init__(self, sam_type="sam2.1_hiera_small", ckpt_path: str | None = None):
-        self.sam_type = sam_type
-        self.sam = SAM()
-        self.sam.build_model(sam_type, ckpt_path)
-        self.gdino = GDINO()
-        self.gdino.build_model()
+    def __init__(
+        self,
+        sam_type="sam2.1_hiera_small",
+        ckpt_path: str | None = None,
+        gdino: GDINO | None = None,
+        sam: SAM | None = None,
+    ):
+        if sam is None:
+            sam = SAM()
+            sam.build_model(sam_type, ckpt_path)
+        self.set_sam(sam)
+        if gdino is None:
+            gdino = GDINO()
+            gdino.build_model()
+        self.gdino = gdino
+
+    def set_sam(self, sam: SAM) -> None:
+        """Switch to an already built SAM variant."""
+        self.sam = sam
+        self.sam_type = sam.sam_type
 
     def predict(
         self,
@@ -19,6 +35,13 @@ class LangSAM:
         texts_prompt: list[str],
         box_threshold: float = 0.3,
         text_threshold: float = 0.25,
+        tile_size: int | None = None,
+        tile_overlap: int = 128,
+        tile_batch_size: int = 4,
+        tile_merge: str = "wbf",
+        tile_iou_threshold: float = 0.5,
+        max_side: int | None = None,
+        mask_format: str = "dense",
     ):
         """Predicts masks for given images and text prompts using GDINO and SAM models.
 
@@ -27,6 +50,19 @@ class LangSAM:
             texts_prompt (list[str]): List of text prompts corresponding to the images.
             box_threshold (float): Threshold for box predictions.
             text_threshold (float): Threshold for text predictions.
+            tile_size (int | None): If set, each image is processed in square tiles of this
+                size (see `_predict_tiled`) instead of whole.
+            tile_overlap (int): Pixels shared by neighbouring tiles; should exceed the
+                largest object that must not be cut.
+            tile_batch_size (int): Tiles per GDINO forward and windows per SAM batch.
+            tile_merge (str): "nms" or "wbf", how duplicates across tile seams are merged.
+            tile_iou_threshold (float): IoU above which boxes from different tiles are merged.
+            max_side (int | None): If set, images whose longer side exceeds it are downscaled
+                to it for detection and segmentation. Boxes are returned in original pixel
+                coordinates and masks as `LazyMasks`, upsampled only when read.
+            mask_format (str): "dense" for (N, H, W) arrays, or "packed" for `PackedMasks`
+                (1 bit per pixel, decoded per mask on access). Tiled predictions are always
+                returned as `PackedMasks`.
 
         Returns:
             list[dict]: List of results containing masks and other outputs for each image.
@@ -39,21 +75,50 @@ class LangSAM:
             }, ...]
         """
 
+        if mask_format not in ("dense", "packed"):
+            raise ValueError(f"Unknown mask_format: {mask_format}")
+        if mask_format == "packed":
+            results = self.predict(
+                images_pil, texts_prompt, box_threshold, text_threshold, tile_size, tile_overlap,
+                tile_batch_size, tile_merge, tile_iou_threshold, max_side,
+            )
+            for result in results:
+                if len(result["masks"]) and not isinstance(result["masks"], PackedMasks):
+                    result["masks"] = PackedMasks.from_dense(result["masks"])
+            return results
+
+        if max_side is not None:
+            return self._predict_downscaled(
+                images_pil, texts_prompt, max_side, box_threshold=box_threshold, text_threshold=text_threshold,
+                tile_size=tile_size, tile_overlap=tile_overlap, tile_batch_size=tile_batch_size,
+                tile_merge=tile_merge, tile_iou_threshold=tile_iou_threshold,
+            )
+
+        if tile_size is not None:
+            return [
+                self._predict_tiled(
+                    image_pil, text_prompt, box_threshold, text_threshold, tile_size, tile_overlap,
+                    tile_batch_size, tile_merge, tile_iou_threshold,
+                )
+                for image_pil, text_prompt in zip(images_pil, texts_prompt)
+            ]
+
         gdino_results = self.gdino.predict(images_pil, texts_prompt, box_threshold, text_threshold)
         all_results = []
         sam_images = []
         sam_boxes = []
         sam_indices = []
         for idx, result in enumerate(gdino_results):
+            # Converted even when nothing was detected, so callers always get host arrays
             processed_result = {
                 **result,
+                "boxes": result["boxes"].cpu().numpy(),
+                "scores": result["scores"].cpu().numpy(),
                 "masks": [],
                 "mask_scores": [],
             }
 
             if result["labels"]:
-                processed_result["boxes"] = result["boxes"].cpu().numpy()
-                processed_result["scores"] = result["scores"].cpu().numpy()
                 sam_images.append(np.asarray(images_pil[idx]))
                 sam_boxes.append(processed_result["boxes"])
                 sam_indices.append(idx)
@@ -72,6 +137,117 @@ class LangSAM:
             print(f"Predicted {len(all_results)} masks")
         return all_results
 
+    def _predict_downscaled(self, images_pil: list[Image.Image], texts_prompt: list[str], max_side: int, **kwargs):
+        """Run `predict` on copies of the images no larger than `max_side`, then map
+        boxes back to the original coordinates and wrap masks in `LazyMasks`."""
+        scales = [min(1.0, max_side / max(image.size)) for image in images_pil]
+        resized = [
+            image
+            if scale == 1.0
+            else image.resize(
+                (max(1, round(image.width * scale)), max(1, round(image.height * scale))),
+                Image.BILINEAR,
+                reducing_gap=2.0,
+            )
+            for image, scale in zip(images_pil, scales)
+        ]
+        results = self.predict(resized, texts_prompt, **kwargs)
+
+        for result, image, small, scale in zip(results, images_pil, resized, scales):
+            if scale == 1.0 or not len(result["labels"]):
+                continue
+            # Undo the exact per-axis factors of the rounded resize
+            factors = np.array([image.width / small.width, image.height / small.height] * 2, dtype=np.float32)
+            result["boxes"] = np.asarray(result["boxes"]) * factors
+            result["masks"] = LazyMasks(np.asarray(result["masks"]), (image.height, image.width))
+        return results
+
+    def _predict_tiled(
+        self,
+        image_pil: Image.Image,
+        text_prompt: str,
+        box_threshold: float,
+        text_threshold: float,
+        tile_size: int,
+        tile_overlap: int,
+        tile_batch_size: int,
+        tile_merge: str,
+        tile_iou_threshold: float,
+    ) -> dict:
+        """Tiled prediction for one large image.
+
+        GDINO runs on batches of overlapping tiles, so small objects keep their
+        resolution and activations are bounded by the tile size. Boxes cut by a
+        seam are dropped when a neighbouring tile saw the whole object, and
+        duplicates from the overlaps are merged with NMS or WBF. SAM then
+        segments each box inside its tile (or a tile-sized window around boxes
+        larger than a tile). Each window mask is bit-packed into full-frame
+        coordinates as it is pasted, so masks are returned as `PackedMasks`
+        and no dense (N, H, W) array is allocated.
+        """
+        image_rgb = np.asarray(image_pil)
+        height, width = image_rgb.shape[:2]
+        tiles = tile_grid(width, height, tile_size, tile_overlap)
+
+        # Batches run one after another: the processor and model are shared and
+        # the GPU forwards would serialize anyway
+        batches = []
+        for start in range(0, len(tiles), tile_batch_size):
+            crops = [image_pil.crop(tuple(int(v) for v in tile)) for tile in tiles[start : start + tile_batch_size]]
+            batches.append(self.gdino.predict(crops, [text_prompt] * len(crops), box_threshold, text_threshold))
+
+        boxes, scores, labels, tile_ids = [], [], [], []
+        for tile_id, result in enumerate(result for batch in batches for result in batch):
+            if not result["labels"]:
+                continue
+            offset = np.tile(tiles[tile_id, :2], 2)
+            boxes.append(result["boxes"].cpu().numpy() + offset)
+            scores.append(result["scores"].cpu().numpy())
+            labels.extend(result["labels"])
+            tile_ids.extend([tile_id] * len(result["labels"]))
+        print(f"Detected {len(labels)} boxes in {len(tiles)} tiles")
+
+        empty = {
+            "boxes": np.zeros((0, 4), dtype=np.float32),
+            "scores": np.zeros(0, dtype=np.float32),
+            "labels": [],
+            "masks": [],
+            "mask_scores": [],
+        }
+        if not labels:
+            return empty
+        boxes, scores = np.concatenate(boxes), np.concatenate(scores)
+        keep = drop_seam_boxes(boxes, np.array(tile_ids), tiles)
+        boxes, scores, labels = merge_boxes(
+            boxes[keep], scores[keep], [label for label, k in zip(labels, keep) if k], tile_merge, tile_iou_threshold
+        )
+
+        windows = mask_windows(boxes, tiles, tile_size, width, height)
+        groups: dict[tuple[int, ...], list[int]] = {}
+        for idx, window in enumerate(windows):
+            groups.setdefault(tuple(int(v) for v in window), []).append(idx)
+        groups = list(groups.items())
+
+        packed = np.zeros((len(boxes), height, (width + 7) // 8), dtype=np.uint8)
+        mask_scores = np.zeros(len(boxes), dtype=np.float32)
+        for start in range(0, len(groups), tile_batch_size):
+            batch = groups[start : start + tile_batch_size]
+            crops = [image_rgb[y0:y1, x0:x1] for (x0, y0, x1, y1), _ in batch]
+            crop_boxes = [boxes[indices] - np.array([x0, y0, x0, y0]) for (x0, y0, _, _), indices in batch]
+            batch_masks, batch_scores, _ = self.sam.predict_batch(crops, xyxy=crop_boxes)
+            for ((x0, y0, x1, y1), indices), window_masks, window_scores in zip(batch, batch_masks, batch_scores):
+                window_masks = window_masks.reshape(len(indices), y1 - y0, x1 - x0)
+                for idx, window_mask in zip(indices, window_masks):
+                    # Pack full-width rows of the window only; x0 need not fall on a byte boundary
+                    rows = np.zeros((y1 - y0, width), dtype=bool)
+                    rows[:, x0:x1] = window_mask > 0
+                    packed[idx, y0:y1] = np.packbits(rows, axis=-1)
+                mask_scores[indices] = np.atleast_1d(window_scores)
+        print(f"Predicted {len(boxes)} masks in {len(groups)} windows")
+
+        masks = PackedMasks(packed, (height, width))
+        return {**empty, "boxes": boxes, "scores": scores, "labels": labels, "masks": masks, "mask_scores": mask_scores}
+
 
 if __name__ == "__main__":
     model = LangSAM()
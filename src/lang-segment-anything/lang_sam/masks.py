@@ -0,0 +1,151 @@
+import cv2
+import numpy as np
+
+
+class LazyMasks:
+    """Masks predicted at reduced resolution, upsampled only when read.
+
+    Holds the (N, h, w) low-resolution masks and the (H, W) size of the
+    original image. Indexing with an int returns one full-resolution boolean
+    mask; slices, lists and `np.asarray` return (k, H, W) boolean arrays.
+    Nothing is cached, so memory stays at the low-resolution size unless the
+    caller keeps the decoded arrays.
+    """
+
+    def __init__(self, low_res: np.ndarray, size: tuple[int, int]):
+        self.low_res = low_res
+        self.size = size
+
+    def __len__(self) -> int:
+        return len(self.low_res)
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return (len(self.low_res), *self.size)
+
+    def _upsample(self, mask: np.ndarray) -> np.ndarray:
+        height, width = self.size
+        resized = cv2.resize(mask.astype(np.float32), (width, height), interpolation=cv2.INTER_LINEAR)
+        return resized >= 0.5
+
+    def __getitem__(self, index) -> np.ndarray:
+        if isinstance(index, (int, np.integer)):
+            return self._upsample(self.low_res[index])
+        selected = self.low_res[index]
+        out = np.zeros((len(selected), *self.size), dtype=bool)
+        for i, mask in enumerate(selected):
+            out[i] = self._upsample(mask)
+        return out
+
+    def __iter__(self):
+        for mask in self.low_res:
+            yield self._upsample(mask)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        masks = self[:]
+        return masks if dtype is None else masks.astype(dtype)
+
+    def astype(self, dtype) -> np.ndarray:
+        return np.asarray(self, dtype=dtype)
+
+
+# Number of set bits in each byte value
+POPCOUNT = np.array([bin(value).count("1") for value in range(256)], dtype=np.uint8)
+
+
+class PackedMasks:
+    """Boolean masks stored as bit-packed rows, 1 bit per pixel.
+
+    `packed` is (N, H, ceil(W / 8)) uint8 as produced by `np.packbits` along
+    the rows. Masks are unpacked one at a time on indexing; `area`, `bbox` and
+    `iou` work on the packed bytes without unpacking. `to_rle`/`from_rle`
+    convert to and from uncompressed COCO run-length encoding.
+    """
+
+    def __init__(self, packed: np.ndarray, size: tuple[int, int]):
+        self.packed = packed
+        self.size = size
+
+    @classmethod
+    def from_dense(cls, masks) -> "PackedMasks":
+        """Pack (N, H, W) masks one at a time; `masks` may be an array or `LazyMasks`."""
+        height, width = masks.shape[1:]
+        packed = np.zeros((len(masks), height, (width + 7) // 8), dtype=np.uint8)
+        for i in range(len(masks)):
+            packed[i] = np.packbits(np.asarray(masks[i]) > 0, axis=-1)
+        return cls(packed, (height, width))
+
+    def __len__(self) -> int:
+        return len(self.packed)
+
+    @property
+    def shape(self) -> tuple[int, int, int]:
+        return (len(self.packed), *self.size)
+
+    @property
+    def nbytes(self) -> int:
+        return self.packed.nbytes
+
+    def _unpack(self, packed: np.ndarray) -> np.ndarray:
+        return np.unpackbits(packed, axis=-1, count=self.size[1]).astype(bool)
+
+    def __getitem__(self, index) -> np.ndarray:
+        return self._unpack(self.packed[index])
+
+    def __iter__(self):
+        for packed in self.packed:
+            yield self._unpack(packed)
+
+    def __array__(self, dtype=None, copy=None) -> np.ndarray:
+        masks = self._unpack(self.packed)
+        return masks if dtype is None else masks.astype(dtype)
+
+    def astype(self, dtype) -> np.ndarray:
+        return np.asarray(self, dtype=dtype)
+
+    def area(self) -> np.ndarray:
+        """Pixel count of each mask."""
+        return POPCOUNT[self.packed].sum(axis=(1, 2), dtype=np.int64)
+
+    def bbox(self) -> np.ndarray:
+        """(N, 4) xyxy boxes (exclusive max) of each mask; all zeros for empty masks."""
+        boxes = np.zeros((len(self.packed), 4), dtype=np.int64)
+        for i, packed in enumerate(self.packed):
+            rows = np.flatnonzero(packed.any(axis=1))
+            if not len(rows):
+                continue
+            columns = np.flatnonzero(np.unpackbits(np.bitwise_or.reduce(packed, axis=0), count=self.size[1]))
+            boxes[i] = [columns[0], rows[0], columns[-1] + 1, rows[-1] + 1]
+        return boxes
+
+    def iou(self, other: "PackedMasks") -> np.ndarray:
+        """(N, M) intersection over union against the masks of `other`."""
+        if self.size != other.size:
+            raise ValueError("Masks must have the same size")
+        areas, other_areas = self.area(), other.area()
+        intersections = np.zeros((len(self), len(other)), dtype=np.int64)
+        for i, packed in enumerate(self.packed):
+            intersections[i] = POPCOUNT[packed[None] & other.packed].sum(axis=(1, 2), dtype=np.int64)
+        unions = areas[:, None] + other_areas[None, :] - intersections
+        return np.divide(intersections, unions, out=np.zeros(unions.shape), where=unions > 0)
+
+    def to_rle(self) -> list[dict]:
+        """Uncompressed COCO RLE per mask: column-major run lengths, starting with zeros."""
+        rles = []
+        for mask in self:
+            pixels = mask.ravel(order="F")
+            changes = np.flatnonzero(pixels[1:] != pixels[:-1]) + 1
+            runs = np.diff(np.concatenate([[0], changes, [pixels.size]]))
+            counts = runs.tolist() if not pixels[0] else [0, *runs.tolist()]
+            rles.append({"size": list(self.size), "counts": counts})
+        return rles
+
+    @classmethod
+    def from_rle(cls, rles: list[dict]) -> "PackedMasks":
+        height, width = rles[0]["size"]
+        packed = np.zeros((len(rles), height, (width + 7) // 8), dtype=np.uint8)
+        for i, rle in enumerate(rles):
+            values = np.arange(len(rle["counts"])) % 2 == 1
+            pixels = np.repeat(values, rle["counts"])
+            packed[i] = np.packbits(pixels.reshape((height, width), order="F"), axis=-1)
+        return cls(packed, (height, width))
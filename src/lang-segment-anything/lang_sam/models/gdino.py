@@ -1,8 +1,14 @@
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import numpy as np
 import torch
 from PIL import Image
 from transformers import AutoModelForZeroShotObjectDetection, AutoProcessor
 
-from lang_sam.models.utils import get_device_type
+from lang_sam.models.utils import get_device_type, image_hash
 
 device_type = get_device_type()
 DEVICE = torch.device(device_type)
@@ -14,16 +20,93 @@ if torch.cuda.is_available():
         torch.backends.cudnn.allow_tf32 = True
 
 
-class GDINO:
-    def __init__(self):
-        self.build_model()
+# Number of image batches whose vision-backbone features are kept; 0 disables reuse
+GDINO_FEATURE_CACHE_SIZE = int(os.getenv("GDINO_FEATURE_CACHE_SIZE", "8"))
+
+
+class BackboneCache(torch.nn.Module):
+    """Wraps the GroundingDINO vision backbone and reuses its output for images seen before.
+
+    Entries are keyed by the tuple of image hashes of a batch (padding depends
+    on the whole batch) and hold the processed `pixel_values`/`pixel_mask`
+    together with the backbone features, so a new prompt on the same images
+    skips both image preprocessing and the Swin forward. The text encoder and
+    the cross-modality encoder/decoder still run. Least recently used entries
+    are dropped beyond `max_entries`.
+
+    `GroundingDinoModel.forward` also reaches into the backbone for its
+    `position_embedding` (to embed the extra feature level) and appends to the
+    returned position list, so the former is forwarded and every call gets
+    fresh lists over the cached tensors.
+    """
+
+    def __init__(self, backbone: torch.nn.Module, max_entries: int):
+        super().__init__()
+        self.backbone = backbone
+        self.max_entries = max_entries
+        self._entries: OrderedDict[tuple[str, ...], dict] = OrderedDict()
+        self._lock = threading.Lock()
+        self._local = threading.local()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    @property
+    def position_embedding(self) -> torch.nn.Module:
+        return self.backbone.position_embedding
 
-    def build_model(self, ckpt_path: str | None = None):
+    @staticmethod
+    def _copy(features: tuple) -> tuple:
+        return tuple(list(part) if isinstance(part, list) else part for part in features)
+
+    def lookup(self, key: tuple[str, ...]) -> dict | None:
+        """Cached processor image inputs for `key`, or None."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return {"pixel_values": entry["pixel_values"], "pixel_mask": entry["pixel_mask"]}
+
+    @contextmanager
+    def use(self, key: tuple[str, ...], pixel_values: torch.Tensor, pixel_mask: torch.Tensor):
+        """Within this block, backbone calls on the current thread are served from or stored under `key`."""
+        self._local.request = (key, pixel_values, pixel_mask)
+        try:
+            yield
+        finally:
+            self._local.request = None
+
+    def forward(self, *args, **kwargs):
+        request = getattr(self._local, "request", None)
+        if request is None:
+            return self.backbone(*args, **kwargs)
+        key, pixel_values, pixel_mask = request
+        with self._lock:
+            entry = self._entries.get(key)
+        if entry is not None:
+            return self._copy(entry["features"])
+
+        features = self.backbone(*args, **kwargs)
+        with self._lock:
+            self._entries[key] = {"pixel_values": pixel_values, "pixel_mask": pixel_mask, "features": features}
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+        return self._copy(features)
+
+
+class GDINO:
+    def build_model(self, ckpt_path: str | None = None, feature_cache_size: int = GDINO_FEATURE_CACHE_SIZE):
         model_id = "IDEA-Research/grounding-dino-base"
         self.processor = AutoProcessor.from_pretrained(model_id)
         self.model = AutoModelForZeroShotObjectDetection.from_pretrained(model_id).to(
             DEVICE
         )
+        self.feature_cache = None
+        if feature_cache_size > 0:
+            self.feature_cache = BackboneCache(self.model.model.backbone, feature_cache_size)
+            self.model.model.backbone = self.feature_cache
 
     def predict(
         self,
@@ -35,9 +118,26 @@ class GDINO:
         for i, prompt in enumerate(text_prompt):
             if prompt[-1] != ".":
                 text_prompt[i] += "."
-        inputs = self.processor(images=pil_images, text=text_prompt, return_tensors="pt").to(DEVICE)
-        with torch.no_grad():
-            outputs = self.model(**inputs)
+        if self.feature_cache is None:
+            # Prompts of a batch tokenize to different lengths; pad them to the longest
+            inputs = self.processor(images=pil_images, text=text_prompt, padding="longest", return_tensors="pt").to(
+                DEVICE
+            )
+            with torch.no_grad():
+                outputs = self.model(**inputs)
+        else:
+            key = tuple(image_hash(np.asarray(image)) for image in pil_images)
+            image_inputs = self.feature_cache.lookup(key)
+            if image_inputs is None:
+                inputs = self.processor(
+                    images=pil_images, text=text_prompt, padding="longest", return_tensors="pt"
+                ).to(DEVICE)
+            else:
+                # Only the prompts need processing; the image side comes from the cache
+                inputs = self.processor(text=text_prompt, padding="longest", return_tensors="pt").to(DEVICE)
+                inputs.update(image_inputs)
+            with torch.no_grad(), self.feature_cache.use(key, inputs["pixel_values"], inputs["pixel_mask"]):
+                outputs = self.model(**inputs)
 
         results = self.processor.post_process_grounded_object_detection(
             outputs,
@@ -52,10 +152,13 @@ class GDINO:
 if __name__ == "__main__":
     gdino = GDINO()
     gdino.build_model()
-    out = gdino.predict(
-        [Image.open("./assets/car.jpeg"), Image.open("./assets/car.jpeg")],
-        ["wheel", "wheel"],
-        0.3,
-        0.25,
-    )
+    images = [Image.open("./assets/car.jpeg"), Image.open("./assets/car.jpeg")]
+    out = gdino.predict(images, ["wheel", "wheel"], 0.3, 0.25)
     print(out)
+    # A second prompt on the same images is served from the backbone cache
+    if gdino.feature_cache is not None:
+        cached = gdino.predict(images, ["car", "wheel"], 0.3, 0.25)
+        repeat = gdino.predict(images, ["wheel", "wheel"], 0.3, 0.25)
+        assert gdino.feature_cache.stats["hits"] == 2, gdino.feature_cache.stats
+        assert all(torch.equal(a["boxes"], b["boxes"]) for a, b in zip(out, repeat))
+        print(cached)
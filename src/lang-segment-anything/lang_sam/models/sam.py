@@ -1,3 +1,7 @@
+import os
+import threading
+from collections import OrderedDict
+
 import numpy as np
 import torch
 from hydra import compose
@@ -6,7 +10,7 @@ from omegaconf import OmegaConf
 from sam2.automatic_mask_generator import SAM2AutomaticMaskGenerator
 from sam2.sam2_image_predictor import SAM2ImagePredictor
 
-from lang_sam.models.utils import get_device_type
+from lang_sam.models.utils import get_device_type, image_hash
 
 DEVICE = torch.device(get_device_type())
 
@@ -37,6 +41,51 @@ SAM_MODELS = {
 }
 
 
+class EmbeddingCache:
+    """Image-encoder outputs of SAM, keyed by image content hash and SAM variant.
+
+    Each entry holds one image's `image_embed`, its `high_res_feats` levels and
+    its original (H, W). Entries are evicted least recently used first once
+    they hold more than `max_bytes`.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self._entries: OrderedDict[tuple[str, str], tuple[dict, int]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "evictions": 0}
+
+    def get(self, key: tuple[str, str]) -> dict | None:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats["hits"] += 1
+            return entry[0]
+
+    def put(self, key: tuple[str, str], features: dict) -> None:
+        tensors = [features["image_embed"], *features["high_res_feats"]]
+        nbytes = sum(t.numel() * t.element_size() for t in tensors)
+        if nbytes > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self.nbytes -= self._entries.pop(key)[1]
+            self._entries[key] = (features, nbytes)
+            self.nbytes += nbytes
+            while self.nbytes > self.max_bytes:
+                _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+                self.nbytes -= evicted_nbytes
+                self.stats["evictions"] += 1
+
+
+# Shared by every SAM variant; 0 disables the cache
+embedding_cache = EmbeddingCache(int(float(os.getenv("SAM_EMBEDDING_CACHE_MB", "512")) * 1024 * 1024))
+
+
 class SAM:
     def build_model(self, sam_type: str, ckpt_path: str | None = None):
         self.sam_type = sam_type
@@ -81,8 +130,46 @@ class SAM:
         sam2_result = self.mask_generator.generate(image_rgb)
         return sam2_result
 
+    def set_images(self, images_rgb: list[np.ndarray], batch: bool = True) -> None:
+        """Set the predictor's image features, running the image encoder only for uncached images.
+
+        Equivalent to `predictor.set_image_batch` (or `set_image` when `batch`
+        is False), with per-image features restored from `embedding_cache`.
+        """
+        if embedding_cache.max_bytes <= 0:
+            if batch:
+                self.predictor.set_image_batch(images_rgb)
+            else:
+                self.predictor.set_image(images_rgb[0])
+            return
+
+        keys = [(image_hash(image), self.sam_type) for image in images_rgb]
+        cached = [embedding_cache.get(key) for key in keys]
+        missing = [idx for idx, features in enumerate(cached) if features is None]
+        if missing:
+            self.predictor.set_image_batch([images_rgb[idx] for idx in missing])
+            features = self.predictor._features
+            for position, idx in enumerate(missing):
+                cached[idx] = {
+                    "image_embed": features["image_embed"][position].clone(),
+                    "high_res_feats": [level[position].clone() for level in features["high_res_feats"]],
+                    "orig_hw": self.predictor._orig_hw[position],
+                }
+                embedding_cache.put(keys[idx], cached[idx])
+
+        self.predictor._features = {
+            "image_embed": torch.stack([entry["image_embed"] for entry in cached]),
+            "high_res_feats": [
+                torch.stack([entry["high_res_feats"][level] for entry in cached])
+                for level in range(len(cached[0]["high_res_feats"]))
+            ],
+        }
+        self.predictor._orig_hw = [entry["orig_hw"] for entry in cached]
+        self.predictor._is_image_set = True
+        self.predictor._is_batch = batch
+
     def predict(self, image_rgb: np.ndarray, xyxy: np.ndarray) -> tuple[np.ndarray, np.ndarray, np.ndarray]:
-        self.predictor.set_image(image_rgb)
+        self.set_images([image_rgb], batch=False)
         masks, scores, logits = self.predictor.predict(box=xyxy, multimask_output=False)
         if len(masks.shape) > 3:
             masks = np.squeeze(masks, axis=1)
@@ -93,7 +180,7 @@ class SAM:
         images_rgb: list[np.ndarray],
         xyxy: list[np.ndarray],
     ) -> tuple[list[np.ndarray], list[np.ndarray], list[np.ndarray]]:
-        self.predictor.set_image_batch(images_rgb)
+        self.set_images(images_rgb)
 
         masks, scores, logits = self.predictor.predict_batch(box_batch=xyxy, multimask_output=False)
 
@@ -0,0 +1,71 @@
+from collections import OrderedDict
+
+import torch
+
+from lang_sam.models.sam import SAM, SAM_MODELS
+
+
+def sam_nbytes(sam: SAM) -> int:
+    """Bytes held by the parameters and buffers of a built SAM model."""
+    tensors = list(sam.model.parameters()) + list(sam.model.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class SAMCache:
+    """Built SAM variants kept in memory, least recently used evicted first.
+
+    `get` returns the SAM for a `sam_type` from `SAM_MODELS`, building it on
+    first use. Once the variants together exceed `memory_budget_mb`, the
+    least recently used ones are dropped; the variant just requested is
+    always kept, even if it alone exceeds the budget.
+    """
+
+    def __init__(self, memory_budget_mb: float | None = None, ckpt_paths: dict[str, str] | None = None):
+        self.memory_budget = None if memory_budget_mb is None else int(float(memory_budget_mb) * 1024 * 1024)
+        self.ckpt_paths = ckpt_paths or {}
+        self._models: OrderedDict[str, tuple[SAM, int]] = OrderedDict()
+        self.stats = {"builds": 0, "hits": 0, "evictions": 0}
+
+    def get(self, sam_type: str) -> SAM:
+        if sam_type not in SAM_MODELS:
+            raise ValueError(f"Unknown sam_type: {sam_type}. Choose one of {list(SAM_MODELS)}")
+        if sam_type in self._models:
+            self._models.move_to_end(sam_type)
+            self.stats["hits"] += 1
+            return self._models[sam_type][0]
+
+        print(f"Building SAM model {sam_type}")
+        sam = SAM()
+        sam.build_model(sam_type, self.ckpt_paths.get(sam_type))
+        self._models[sam_type] = (sam, sam_nbytes(sam))
+        self.stats["builds"] += 1
+        self._evict()
+        print(f"SAM cache: {self.metrics()}")
+        return sam
+
+    def preload(self, sam_types: list[str]) -> None:
+        for sam_type in sam_types:
+            self.get(sam_type)
+
+    def _evict(self) -> None:
+        if self.memory_budget is None:
+            return
+        evicted = False
+        while len(self._models) > 1 and self.nbytes > self.memory_budget:
+            sam_type, _ = self._models.popitem(last=False)
+            self.stats["evictions"] += 1
+            evicted = True
+            print(f"Evicted SAM model {sam_type}")
+        if evicted and torch.cuda.is_available():
+            torch.cuda.empty_cache()
+
+    @property
+    def nbytes(self) -> int:
+        return sum(nbytes for _, nbytes in self._models.values())
+
+    def metrics(self) -> dict:
+        return {
+            **self.stats,
+            "resident": list(self._models),
+            "resident_mb": round(self.nbytes / 1024 / 1024, 1),
+        }
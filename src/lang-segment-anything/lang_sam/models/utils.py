@@ -1,5 +1,7 @@
+import hashlib
 import logging
 
+import numpy as np
 import torch
 
 
@@ -11,3 +13,10 @@ def get_device_type() -> str:
     else:
         logging.warning("No GPU found, using CPU instead")
         return "cpu"
+
+
+def image_hash(image_rgb: np.ndarray) -> str:
+    """Content hash of an image array, shape included."""
+    digest = hashlib.blake2b(str(image_rgb.shape).encode(), digest_size=16)
+    digest.update(np.ascontiguousarray(image_rgb).data)
+    return digest.hexdigest()
@@ -1,3 +1,4 @@
+import os
 from io import BytesIO
 
 import litserve as ls
@@ -5,16 +6,26 @@ import numpy as np
 from fastapi import Response, UploadFile
 from PIL import Image
 
-from lang_sam import LangSAM
+from lang_sam import SAM_MODELS, LangSAM
+from lang_sam.models.sam_cache import SAMCache
 from lang_sam.utils import draw_image
 
 PORT = 8000
+# Requests arriving within BATCH_TIMEOUT seconds of each other are predicted together
+MAX_BATCH_SIZE = int(os.getenv("LANGSAM_MAX_BATCH_SIZE", "4"))
+BATCH_TIMEOUT = float(os.getenv("LANGSAM_BATCH_TIMEOUT", "0.05"))
+DEFAULT_SAM_TYPE = os.getenv("LANGSAM_SAM_TYPE", "sam2.1_hiera_small")
+# Built SAM variants are kept per worker up to this many MB (unset: no limit)
+SAM_CACHE_BUDGET_MB = os.getenv("LANGSAM_SAM_CACHE_MB")
+SAM_PRELOAD = [name for name in os.getenv("LANGSAM_SAM_PRELOAD", DEFAULT_SAM_TYPE).split(",") if name]
 
 
 class LangSAMAPI(ls.LitAPI):
     def setup(self, device: str) -> None:
         """Initialize or load the LangSAM model."""
-        self.model = LangSAM(sam_type="sam2.1_hiera_small")
+        self.sam_cache = SAMCache(memory_budget_mb=SAM_CACHE_BUDGET_MB)
+        self.sam_cache.preload(SAM_PRELOAD)
+        self.model = LangSAM(sam=self.sam_cache.get(DEFAULT_SAM_TYPE))
         print("LangSAM model initialized.")
 
     def decode_request(self, request) -> dict:
@@ -26,12 +37,27 @@ class LangSAMAPI(ls.LitAPI):
         - text_threshold: float
         - text_prompt: str
         - image: UploadFile
+
+        LitServe decodes a whole batch inside one `try`, so an invalid request
+        is returned as `{"error": message}` instead of raising; `predict` skips
+        it and `encode_response` answers it with a 400.
         """
+        try:
+            return self._decode(request)
+        except ValueError as e:
+            return {"error": str(e)}
+
+    def _decode(self, request) -> dict:
         # Extract form data
-        sam_type = request.get("sam_type")
+        sam_type = request.get("sam_type") or DEFAULT_SAM_TYPE
+        if sam_type not in SAM_MODELS:
+            # Reported for this request only, through the error marker of decode_request
+            raise ValueError(f"Unknown sam_type: {sam_type}")
         box_threshold = float(request.get("box_threshold", 0.3))
         text_threshold = float(request.get("text_threshold", 0.25))
         text_prompt = request.get("text_prompt", "")
+        if not text_prompt.strip():
+            raise ValueError("No text prompt provided in the request.")
 
         # Extract image file
         image_file: UploadFile = request.get("image")
@@ -39,49 +65,71 @@ class LangSAMAPI(ls.LitAPI):
             raise ValueError("No image file provided in the request.")
 
         image_bytes = image_file.file.read()
+        try:
+            image_pil = Image.open(BytesIO(image_bytes)).convert("RGB")
+        except Exception as e:
+            raise ValueError(f"Invalid image data: {e}")
 
         return {
             "sam_type": sam_type,
             "box_threshold": box_threshold,
             "text_threshold": text_threshold,
-            "image_bytes": image_bytes,
+            "image_pil": image_pil,
             "text_prompt": text_prompt,
         }
 
-    def predict(self, inputs: dict) -> dict:
-        """Perform prediction using the LangSAM model.
-
-        Yields:
-            dict: Contains the processed output image.
-        """
-        print("Starting prediction with parameters:")
-        print(
-            f"sam_type: {inputs['sam_type']}, \
-                box_threshold: {inputs['box_threshold']}, \
-                text_threshold: {inputs['text_threshold']}, \
-                text_prompt: {inputs['text_prompt']}"
-        )
+    def batch(self, inputs: list[dict]) -> list[dict]:
+        """Keep the decoded requests as a list; they are grouped in `predict`."""
+        return inputs
 
-        if inputs["sam_type"] != self.model.sam_type:
-            print(f"Updating SAM model type to {inputs['sam_type']}")
-            self.model.sam.build_model(inputs["sam_type"])
+    def predict(self, inputs: dict | list[dict]) -> dict | list[dict]:
+        """Perform prediction using the LangSAM model.
 
-        try:
-            image_pil = Image.open(BytesIO(inputs["image_bytes"])).convert("RGB")
-        except Exception as e:
-            raise ValueError(f"Invalid image data: {e}")
-
-        results = self.model.predict(
-            images_pil=[image_pil],
-            texts_prompt=[inputs["text_prompt"]],
-            box_threshold=inputs["box_threshold"],
-            text_threshold=inputs["text_threshold"],
-        )
-        results = results[0]
+        With batching enabled `inputs` is a list of requests. Requests sharing
+        `sam_type` and thresholds are predicted together, so GDINO and SAM run
+        one batched forward per group.
 
+        Returns:
+            dict | list[dict]: Contains the processed output image, per request.
+        """
+        batch = inputs if isinstance(inputs, list) else [inputs]
+        outputs = [None] * len(batch)
+        groups = {}
+        for idx, request in enumerate(batch):
+            if "error" in request:
+                outputs[idx] = request
+                continue
+            key = (request["sam_type"], request["box_threshold"], request["text_threshold"])
+            groups.setdefault(key, []).append(idx)
+
+        for (sam_type, box_threshold, text_threshold), indices in groups.items():
+            print(
+                f"Predicting {len(indices)} request(s) with sam_type: {sam_type}, "
+                f"box_threshold: {box_threshold}, text_threshold: {text_threshold}"
+            )
+
+            if sam_type != self.model.sam_type:
+                print(f"Switching SAM model type to {sam_type}")
+                self.model.set_sam(self.sam_cache.get(sam_type))
+
+            results = self.model.predict(
+                images_pil=[batch[idx]["image_pil"] for idx in indices],
+                texts_prompt=[batch[idx]["text_prompt"] for idx in indices],
+                box_threshold=box_threshold,
+                text_threshold=text_threshold,
+            )
+            for idx, result in zip(indices, results):
+                outputs[idx] = {"output_image": self._draw(batch[idx]["image_pil"], result)}
+
+        return outputs if isinstance(inputs, list) else outputs[0]
+
+    def unbatch(self, output: list[dict]) -> list[dict]:
+        return output
+
+    def _draw(self, image_pil: Image.Image, results: dict) -> Image.Image:
         if not len(results["masks"]):
             print("No masks detected. Returning original image.")
-            return {"output_image": image_pil}
+            return image_pil
 
         # Draw results on the image
         image_array = np.asarray(image_pil)
@@ -92,9 +140,7 @@ class LangSAMAPI(ls.LitAPI):
             results["scores"],
             results["labels"],
         )
-        output_image = Image.fromarray(np.uint8(output_image)).convert("RGB")
-
-        return {"output_image": output_image}
+        return Image.fromarray(np.uint8(output_image)).convert("RGB")
 
     def encode_response(self, output: dict) -> Response:
         """Encode the prediction result into an HTTP response.
@@ -102,6 +148,8 @@ class LangSAMAPI(ls.LitAPI):
         Returns:
             Response: Contains the processed image in PNG format.
         """
+        if "error" in output:
+            return Response(content=output["error"], status_code=400, media_type="text/plain")
         try:
             image = output["output_image"]
             buffer = BytesIO()
@@ -113,7 +161,7 @@ class LangSAMAPI(ls.LitAPI):
 
 
 lit_api = LangSAMAPI()
-server = ls.LitServer(lit_api)
+server = ls.LitServer(lit_api, max_batch_size=MAX_BATCH_SIZE, batch_timeout=BATCH_TIMEOUT)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,144 @@
+import numpy as np
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: int) -> np.ndarray:
+    """Tiles covering the image, as an (N, 4) array of xyxy pixel windows.
+
+    Tiles are `tile_size` square and spread evenly from edge to edge, using
+    the fewest tiles that keep at least `overlap` pixels between neighbours.
+    """
+    if not 0 <= overlap < tile_size:
+        raise ValueError("tile_overlap must be smaller than tile_size")
+
+    def starts(length: int) -> list[int]:
+        if length <= tile_size:
+            return [0]
+        count = int(np.ceil((length - tile_size) / (tile_size - overlap))) + 1
+        return np.linspace(0, length - tile_size, count).round().astype(int).tolist()
+
+    return np.array(
+        [
+            [x, y, min(x + tile_size, width), min(y + tile_size, height)]
+            for y in starts(height)
+            for x in starts(width)
+        ],
+        dtype=np.int64,
+    )
+
+
+def box_iou(box: np.ndarray, boxes: np.ndarray) -> np.ndarray:
+    """IoU of one xyxy box against an (N, 4) array of boxes."""
+    x0 = np.maximum(box[0], boxes[:, 0])
+    y0 = np.maximum(box[1], boxes[:, 1])
+    x1 = np.minimum(box[2], boxes[:, 2])
+    y1 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x1 - x0, 0, None) * np.clip(y1 - y0, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / np.maximum(area + areas - intersection, 1e-9)
+
+
+def drop_seam_boxes(boxes: np.ndarray, tile_ids: np.ndarray, tiles: np.ndarray, margin: float = 2.0) -> np.ndarray:
+    """Mask of boxes to keep after removing objects cut by a tile seam.
+
+    A box touching an edge of its tile that is not an image edge shows only
+    part of an object. When another tile contains that box entirely, the
+    neighbour saw the whole object (the cut part lies in the overlap), so the
+    partial box is dropped.
+    """
+    keep = np.ones(len(boxes), dtype=bool)
+    image_x1, image_y1 = tiles[:, 2].max(), tiles[:, 3].max()
+    for i, (box, tile_id) in enumerate(zip(boxes, tile_ids)):
+        tx0, ty0, tx1, ty1 = tiles[tile_id]
+        cut = (
+            (tx0 > 0 and box[0] <= tx0 + margin)
+            or (ty0 > 0 and box[1] <= ty0 + margin)
+            or (tx1 < image_x1 and box[2] >= tx1 - margin)
+            or (ty1 < image_y1 and box[3] >= ty1 - margin)
+        )
+        if not cut:
+            continue
+        contained = (
+            (tiles[:, 0] <= box[0]) & (tiles[:, 1] <= box[1]) & (tiles[:, 2] >= box[2]) & (tiles[:, 3] >= box[3])
+        )
+        contained[tile_id] = False
+        keep[i] = not contained.any()
+    return keep
+
+
+def merge_boxes(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    labels: list[str],
+    method: str = "wbf",
+    iou_threshold: float = 0.5,
+) -> tuple[np.ndarray, np.ndarray, list[str]]:
+    """Merge duplicate detections of the same label from overlapping tiles.
+
+    Parameters:
+        boxes (np.ndarray): (N, 4) xyxy boxes in full-image coordinates.
+        scores (np.ndarray): (N,) confidence scores.
+        labels (list[str]): Label of each box; only equal labels are merged.
+        method (str): "nms" keeps the best box of each cluster, "wbf" fuses the
+            cluster into its score-weighted average box.
+        iou_threshold (float): IoU above which two boxes are the same object.
+
+    Returns:
+        tuple[np.ndarray, np.ndarray, list[str]]: Merged boxes, scores and labels.
+    """
+    if method not in ("nms", "wbf"):
+        raise ValueError(f"Unknown merge method: {method}")
+    merged_boxes, merged_scores, merged_labels = [], [], []
+    for label in dict.fromkeys(labels):
+        idx = np.array([i for i, lab in enumerate(labels) if lab == label])
+        idx = idx[np.argsort(-scores[idx])]
+        clusters: list[list[int]] = []
+        representatives: list[np.ndarray] = []
+        for i in idx:
+            if representatives:
+                ious = box_iou(boxes[i], np.array(representatives))
+                best = int(np.argmax(ious))
+                if ious[best] > iou_threshold:
+                    clusters[best].append(i)
+                    if method == "wbf":
+                        weights = scores[clusters[best]]
+                        representatives[best] = (boxes[clusters[best]] * weights[:, None]).sum(0) / weights.sum()
+                    continue
+            clusters.append([i])
+            representatives.append(boxes[i].astype(np.float64))
+        for cluster, representative in zip(clusters, representatives):
+            merged_boxes.append(representative)
+            merged_scores.append(scores[cluster].max())
+            merged_labels.append(label)
+    return (
+        np.array(merged_boxes, dtype=np.float32).reshape(-1, 4),
+        np.array(merged_scores, dtype=np.float32),
+        merged_labels,
+    )
+
+
+def mask_windows(boxes: np.ndarray, tiles: np.ndarray, tile_size: int, width: int, height: int) -> np.ndarray:
+    """Window to segment each box in: the containing tile whose centre is
+    nearest the box, or for boxes no tile contains a `tile_size` (or larger)
+    window centred on the box, clipped to the image."""
+    windows = np.zeros((len(boxes), 4), dtype=np.int64)
+    tile_centres = (tiles[:, :2] + tiles[:, 2:]) / 2
+    for i, box in enumerate(boxes):
+        contained = (
+            (tiles[:, 0] <= box[0]) & (tiles[:, 1] <= box[1]) & (tiles[:, 2] >= box[2]) & (tiles[:, 3] >= box[3])
+        )
+        if contained.any():
+            candidates = np.flatnonzero(contained)
+            distances = np.linalg.norm(tile_centres[candidates] - (box[:2] + box[2:]) / 2, axis=1)
+            windows[i] = tiles[candidates[np.argmin(distances)]]
+            continue
+        cx, cy = (box[:2] + box[2:]) / 2
+        half_w = max(tile_size, box[2] - box[0]) / 2
+        half_h = max(tile_size, box[3] - box[1]) / 2
+        windows[i] = [
+            max(0, int(cx - half_w)),
+            max(0, int(cy - half_h)),
+            min(width, int(np.ceil(cx + half_w))),
+            min(height, int(np.ceil(cy + half_h))),
+        ]
+    return windows
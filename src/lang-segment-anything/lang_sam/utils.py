@@ -19,17 +19,30 @@ def draw_image(image_rgb, masks, xyxy, probs, labels):
     class_id_map = {label: idx for idx, label in enumerate(unique_labels)}
     class_id = [class_id_map[label] for label in labels]
 
+    # Compact masks (PackedMasks, LazyMasks) are drawn one at a time instead of expanded to (N, H, W)
+    dense = isinstance(masks, np.ndarray)
+
     # Add class_id to the Detections object
     detections = sv.Detections(
-        xyxy=xyxy,
-        mask=masks.astype(bool),
+        xyxy=np.asarray(xyxy),
+        mask=masks.astype(bool) if dense else None,
         confidence=probs,
         class_id=np.array(class_id),
     )
     annotated_image = box_annotator.annotate(scene=image_rgb.copy(), detections=detections)
     annotated_image = label_annotator.annotate(scene=annotated_image, detections=detections, labels=labels)
-    annotated_image = mask_annotator.annotate(scene=annotated_image, detections=detections)
-    return annotated_image
+    if dense:
+        return mask_annotator.annotate(scene=annotated_image, detections=detections)
+    return overlay_masks(annotated_image, masks, class_id, mask_annotator.color, mask_annotator.opacity)
+
+
+def overlay_masks(scene, masks, class_id, palette, opacity):
+    """Same overlay as `sv.MaskAnnotator`, decoding one mask at a time, largest first."""
+    colored_mask = scene.copy()
+    areas = masks.area() if hasattr(masks, "area") else [masks[i].sum() for i in range(len(masks))]
+    for i in np.flip(np.argsort(areas)):
+        colored_mask[masks[int(i)]] = palette.by_idx(class_id[i]).as_bgr()
+    return cv2.addWeighted(colored_mask, opacity, scene, 1 - opacity, 0)
 
 
 def get_contours(mask):
@@ -57,7 +70,8 @@ def generate_labelme_json(binary_masks, labels, image_size, image_path=None):
     """Generate a LabelMe format JSON file from binary mask tensor.
 
     Args:
-        binary_masks: Binary mask tensor of shape [N, H, W].
+        binary_masks: Binary mask tensor of shape [N, H, W], or a mask container
+            (`PackedMasks`, `LazyMasks`) decoded one mask at a time.
         labels: List of labels for each mask.
         image_size: Tuple of (height, width) for the image size.
         image_path: Path to the image file (optional).
@@ -66,7 +80,6 @@ def generate_labelme_json(binary_masks, labels, image_size, image_path=None):
         A dictionary representing the LabelMe JSON file.
     """
     num_masks = binary_masks.shape[0]
-    binary_masks = binary_masks.numpy()
 
     json_dict = {
         "version": "4.5.6",
@@ -81,6 +94,8 @@ def generate_labelme_json(binary_masks, labels, image_size, image_path=None):
     # Loop through the masks and add them to the JSON dictionary
     for i in range(num_masks):
         mask = binary_masks[i]
+        if hasattr(mask, "numpy"):
+            mask = mask.numpy()
         label = labels[i]
         effContours = get_contours(mask)
 
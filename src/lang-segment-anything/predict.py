@@ -10,7 +10,7 @@ text_prompt = "car."
 import time
 start_time = time.time()
 
-results = model.predict([image_pil], [text_prompt], box_threshold=0.23)
+results = model.predict([image_pil], [text_prompt], box_threshold=0.23, mask_format="packed")
 
 # Calcola il tempo di esecuzione
 end_time = time.time()
@@ -39,8 +39,17 @@ try:
 
     # Printa e salva i risultati in un numpyarray
     #print(results)
-    # Salva i risultati in un numpy array npz
-    np.savez("results.npz", results=results)
+    # Salva i risultati come array semplici (niente pickle): le maschere restano compresse a 1 bit per pixel
+    arrays = {}
+    for i, result in enumerate(results):
+        arrays[f"boxes_{i}"] = np.asarray(result["boxes"])
+        arrays[f"scores_{i}"] = np.asarray(result["scores"])
+        arrays[f"labels_{i}"] = np.array(result["labels"], dtype=str)
+        if len(result["masks"]):
+            arrays[f"masks_{i}"] = result["masks"].packed
+            arrays[f"mask_size_{i}"] = np.array(result["masks"].size)
+            arrays[f"mask_scores_{i}"] = np.asarray(result["mask_scores"])
+    np.savez_compressed("results.npz", **arrays)
     
 
     plt.title("Immagine con Predizioni")
@@ -0,0 +1,184 @@
+import itertools
+import os
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+SAM_TYPE = os.getenv("SAM_TYPE", "sam2.1_hiera_small")
+SENTENCE_MODEL_NAME = os.getenv("SENTENCE_MODEL", "paraphrase-MiniLM-L6-v2")
+WHISPER_MODEL_NAME = os.getenv("WHISPER_MODEL", "openai/whisper-small")
+
+
+def module_nbytes(module):
+    """Bytes held by the parameters and buffers of a torch module."""
+    tensors = itertools.chain(module.parameters(), module.buffers())
+    return sum(t.numel() * t.element_size() for t in tensors)
+
+
+class _Entry:
+    def __init__(self, model, nbytes, exclusive):
+        self.model = model
+        self.nbytes = nbytes
+        self.lock = threading.Lock() if exclusive else None
+        self.users = 0
+
+
+class ModelRegistry:
+    """Process-wide cache of warm models shared by every request.
+
+    Models are built lazily on first use and kept in LRU order. When the total
+    size goes over ``memory_budget_mb`` the least recently used models that no
+    request is currently holding are dropped. GroundingDINO is built once and
+    shared by every SAM variant, so it is never evicted.
+
+    Models with per-call state (the SAM predictor, the Whisper pipeline) are
+    handed out under an exclusive lock; the sentence model is shared freely.
+    """
+
+    def __init__(self, memory_budget_mb=None):
+        self.memory_budget = int(float(memory_budget_mb) * 1024**2) if memory_budget_mb else None
+        self._entries = OrderedDict()
+        self._loading = {}
+        self._lock = threading.Lock()
+        self._gdino = None
+        self._gdino_lock = threading.Lock()
+        self.stats = {"builds": 0, "hits": 0, "evictions": 0}
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return self._pinned_nbytes() + sum(entry.nbytes for entry in self._entries.values())
+
+    def _pinned_nbytes(self):
+        return module_nbytes(self._gdino.model) if self._gdino is not None else 0
+
+    def _checkout(self, key):
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            entry.users += 1
+            self.stats["hits"] += 1
+        return entry
+
+    def _acquire(self, key, loader, sizer, exclusive):
+        with self._lock:
+            entry = self._checkout(key)
+            if entry is not None:
+                return entry
+            load_lock = self._loading.setdefault(key, threading.Lock())
+
+        # Only one thread builds a given model; the others wait and reuse it.
+        with load_lock:
+            with self._lock:
+                entry = self._checkout(key)
+                if entry is not None:
+                    return entry
+            print(f"Loading model '{key}'")
+            model = loader()
+            entry = _Entry(model, sizer(model), exclusive)
+            with self._lock:
+                entry.users += 1
+                self._entries[key] = entry
+                self._loading.pop(key, None)
+                self.stats["builds"] += 1
+                self._evict()
+        return entry
+
+    def _evict(self):
+        if self.memory_budget is None:
+            return
+        total = self._pinned_nbytes() + sum(entry.nbytes for entry in self._entries.values())
+        evicted = False
+        for key in list(self._entries):
+            if total <= self.memory_budget:
+                break
+            entry = self._entries[key]
+            if entry.users:
+                continue
+            print(f"Evicting model '{key}' ({entry.nbytes / 1024**2:.0f} MB)")
+            del self._entries[key]
+            total -= entry.nbytes
+            self.stats["evictions"] += 1
+            evicted = True
+        if evicted:
+            _release_device_memory()
+
+    def _release(self, entry):
+        with self._lock:
+            entry.users -= 1
+
+    @contextmanager
+    def _use(self, key, loader, sizer, exclusive=False):
+        entry = self._acquire(key, loader, sizer, exclusive)
+        try:
+            if entry.lock is None:
+                yield entry.model
+            else:
+                with entry.lock:
+                    yield entry.model
+        finally:
+            self._release(entry)
+
+    def gdino(self):
+        with self._gdino_lock:
+            if self._gdino is None:
+                from lang_sam.models.gdino import GDINO
+
+                print("Loading model 'gdino'")
+                gdino = GDINO()
+                gdino.build_model()
+                self._gdino = gdino
+        return self._gdino
+
+    def langsam(self, sam_type=None):
+        """Warm LangSAM for ``sam_type``; every variant shares one GroundingDINO."""
+        sam_type = sam_type or SAM_TYPE
+
+        def load():
+            from lang_sam import LangSAM
+
+            return LangSAM(sam_type=sam_type, gdino=self.gdino())
+
+        return self._use(("langsam", sam_type), load, lambda model: module_nbytes(model.sam.model), exclusive=True)
+
+    def sentence_model(self, name=None):
+        name = name or SENTENCE_MODEL_NAME
+
+        def load():
+            from sentence_transformers import SentenceTransformer
+
+            return SentenceTransformer(name)
+
+        return self._use(("sentence", name), load, module_nbytes)
+
+    def whisper(self, name=None):
+        name = name or WHISPER_MODEL_NAME
+
+        def load():
+            from transformers import pipeline
+
+            return pipeline("automatic-speech-recognition", model=name)
+
+        return self._use(("whisper", name), load, lambda model: module_nbytes(model.model), exclusive=True)
+
+    def preload(self, names):
+        """Build the named models up front, e.g. ``["sentence", "whisper", "langsam"]``."""
+        loaders = {"sentence": self.sentence_model, "whisper": self.whisper, "langsam": self.langsam}
+        for name in names:
+            name = name.strip()
+            if name not in loaders:
+                continue
+            with loaders[name]():
+                pass
+
+
+def _release_device_memory():
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.empty_cache()
+
+
+registry = ModelRegistry(memory_budget_mb=os.getenv("MODEL_MEMORY_BUDGET_MB"))
@@ -0,0 +1,79 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import cv2
+
+from color_engine import ColorIndex
+from NLP import LLM_MODE, answer_query, detect, match_intents, render_highlight, resolve_filter
+from image_io import load_image
+from segment_table import build_segment_table
+from sessions import memoize
+
+# OpenCV, NumPy and torch release the GIL, so threads are enough to overlap the stages
+executor = ThreadPoolExecutor(max_workers=int(os.getenv("PIPELINE_WORKERS", "8")), thread_name_prefix="pipeline")
+
+
+async def main_predict_async(image, query, sam_type=None, llm_mode=None, response_mode="image",
+                             image_format="png", quality=None, session=None):
+    """Same result as ``main_predict`` with independent stages overlapped.
+
+    ``image`` is a decoded RGB array (or a path, decoded first); with an image
+    ``session`` its stored image and earlier results are reused. HSV labelling
+    runs while the intent is matched and LangSAM detects; rendering runs while
+    the answer is produced. Returns ``(text, rendered, timings)`` where
+    ``timings`` maps each stage (and ``total``) to seconds.
+    """
+    loop = asyncio.get_running_loop()
+    timings = {}
+    start = time.perf_counter()
+
+    async def stage(name, fn, *args):
+        stage_start = time.perf_counter()
+        try:
+            return await loop.run_in_executor(executor, fn, *args)
+        finally:
+            timings[name] = time.perf_counter() - stage_start
+
+    async def index_colors():
+        return await stage("color_index", memoize, session, "color_index", ColorIndex, image, cv2.COLOR_RGB2HSV)
+
+    async def detection():
+        selected = await stage("intent", match_intents, query)
+        detections = await stage(
+            "detect", memoize, session, ("boxes", selected, sam_type), detect, image, selected, sam_type
+        )
+        return selected, detections
+
+    structured = (llm_mode or LLM_MODE) == "single"
+    try:
+        if session is not None:
+            image = session.image
+        elif isinstance(image, str):
+            image = await stage("decode", load_image, image)
+        color_index, (selected, (boxes, classes)) = await asyncio.gather(index_colors(), detection())
+        image_height, image_width, _ = image.shape
+
+        stage_start = time.perf_counter()
+        df = memoize(
+            session, ("table", selected, sam_type),
+            lambda: build_segment_table(boxes, image.shape, color_index.classify(boxes), classes, selected),
+        )
+        timings["features"] = time.perf_counter() - stage_start
+
+        filtered_data, output_variable, answer_template = await stage(
+            "filter", resolve_filter, df, query, image_width, image_height, structured
+        )
+        image_base64, answer = await asyncio.gather(
+            stage("render", render_highlight, image, filtered_data, response_mode, image_format, quality),
+            stage("answer", answer_query, query, filtered_data, output_variable, answer_template),
+        )
+    except Exception as e:
+        print(f"An error occurred: {e}")
+        return None, None, timings
+    finally:
+        timings["total"] = time.perf_counter() - start
+        print("Stage timings: " + ", ".join(f"{name}={seconds * 1000:.0f}ms" for name, seconds in timings.items()))
+
+    return answer, image_base64, timings
@@ -0,0 +1,194 @@
+import re
+
+import numpy as np
+
+from segment_table import COLOR_CATEGORIES
+
+COUNT_PHRASES = ("how many", "number of", "count")
+FILLER_WORDS = {
+    "a", "an", "the", "all", "any", "every", "some", "each",
+    "is", "are", "there", "do", "does", "you", "i", "can", "see", "me", "please",
+    "show", "find", "select", "return", "give", "list", "get", "highlight", "detect", "display", "mark",
+    "what", "which", "where", "how", "many", "number", "count", "total",
+    "in", "on", "at", "of", "to", "from", "with", "that", "those", "these", "them", "and", "or",
+    "image", "picture", "photo", "scene", "space", "side", "part", "half", "area", "region", "corner",
+    "object", "objects", "ones", "located", "positioned", "placed", "visible",
+}
+COLOR_WORDS = {"color", "colour", "colored", "coloured"}
+COLOR_ALIASES = {"grey": "gray"}
+POSITIONS = {
+    "left": "left", "right": "right",
+    "top": "top", "upper": "top", "bottom": "bottom", "lower": "bottom",
+    "center": "center", "centre": "center", "middle": "center", "central": "center",
+}
+SIZES = {"big": "large", "large": "large", "huge": "large", "small": "small", "little": "small", "tiny": "small"}
+# "large"/"small" as a fraction of the image area, so they do not depend on what else was detected
+LARGE_MIN_RELATIVE_AREA = 0.01
+SMALL_MAX_RELATIVE_AREA = 0.001
+SUPERLATIVES = {
+    "largest": "largest", "biggest": "largest",
+    "smallest": "smallest", "tiniest": "smallest",
+}
+NUMBER_WORDS = {
+    "one": 1, "two": 2, "three": 3, "four": 4, "five": 5,
+    "six": 6, "seven": 7, "eight": 8, "nine": 9, "ten": 10,
+}
+
+
+class QueryPlan:
+    """Filter/aggregate plan over the segment table.
+
+    Filters are ANDed across kinds (colors are ORed among themselves), then an
+    optional superlative keeps the ``limit`` largest or smallest rows, and
+    ``aggregate`` is either ``"count"`` or ``"rows"``.
+    """
+
+    def __init__(self):
+        self.classes = []
+        self.colors = []
+        self.positions = []
+        self.size = None
+        self.order = None
+        self.limit = None
+        self.aggregate = "rows"
+
+    def describe(self):
+        parts = [f"aggregate={self.aggregate}"]
+        for name in ("classes", "colors", "positions", "size", "order", "limit"):
+            value = getattr(self, name)
+            if value:
+                parts.append(f"{name}={value}")
+        return f"QueryPlan({', '.join(parts)})"
+
+    __repr__ = describe
+
+    def answer_template(self):
+        """Short answer with a ``{count}`` placeholder, filled in after :meth:`run`."""
+        words = [self.order] if self.order else []
+        if self.size:
+            words.append(self.size)
+        words += self.colors
+        words.append(" or ".join(self.classes) if self.classes else "objects")
+        subject = " ".join(words)
+        if self.positions:
+            subject += f" ({' '.join(self.positions)})"
+        subject = subject[0].upper() + subject[1:]
+        if self.aggregate == "count":
+            return f"{subject}: {{count}}."
+        return f"{subject}: {{count}} highlighted."
+
+    def run(self, df, image_width, image_height):
+        """Return ``(filtered_data, output_variable)`` like the generated code does."""
+        keep = np.ones(len(df), dtype=bool)
+        if self.classes and "class" in df.columns:
+            keep &= df["class"].isin(self.classes).to_numpy()
+        if self.colors:
+            keep &= df["color"].isin(self.colors).to_numpy()
+
+        mean_x = df["mean_x"].to_numpy()
+        mean_y = df["mean_y"].to_numpy()
+        for position in self.positions:
+            if position == "left":
+                keep &= mean_x < image_width / 2
+            elif position == "right":
+                keep &= mean_x >= image_width / 2
+            elif position == "top":
+                keep &= mean_y < image_height / 2
+            elif position == "bottom":
+                keep &= mean_y >= image_height / 2
+            elif position == "center":
+                keep &= (np.abs(mean_x - image_width / 2) < image_width / 6)
+                keep &= (np.abs(mean_y - image_height / 2) < image_height / 6)
+
+        if self.size is not None:
+            relative_area = df["area"].to_numpy() / (image_width * image_height)
+            if self.size == "large":
+                keep &= relative_area >= LARGE_MIN_RELATIVE_AREA
+            else:
+                keep &= relative_area <= SMALL_MAX_RELATIVE_AREA
+
+        filtered_data = df[keep]
+        if self.order is not None:
+            ascending = self.order == "smallest"
+            filtered_data = filtered_data.sort_values("area", ascending=ascending, kind="stable")
+            filtered_data = filtered_data.head(self.limit or 1)
+
+        if self.aggregate == "count":
+            return filtered_data, len(filtered_data)
+        return filtered_data, filtered_data
+
+
+def _singular(word):
+    if word.endswith("es") and word[:-2]:
+        return [word, word[:-1], word[:-2]]
+    if word.endswith("s") and word[:-1]:
+        return [word, word[:-1]]
+    return [word]
+
+
+def compile_query(query, class_names=()):
+    """Parse a simple query into a :class:`QueryPlan`, or return ``None``.
+
+    Every word has to be understood; anything else (negations, comparisons,
+    arithmetic, unknown words) returns ``None`` so the caller can fall back to
+    code generation.
+    """
+    text = " ".join(re.findall(r"[a-z0-9]+", query.lower()))
+    if not text:
+        return None
+
+    plan = QueryPlan()
+    if any(re.search(rf"\b{phrase}\b", text) for phrase in COUNT_PHRASES):
+        plan.aggregate = "count"
+
+    classes = {name.strip().lower(): name.strip() for name in class_names if name.strip()}
+    words = text.split()
+    for i, word in enumerate(words):
+        word = COLOR_ALIASES.get(word, word)
+        following = words[i + 1] if i + 1 < len(words) else ""
+        if word == "other" and following not in COLOR_WORDS:
+            # "the other ships" is not the "other" color bucket
+            return None
+        if word in COLOR_WORDS:
+            if i == 0 or words[i - 1] != "other":
+                # "what color is the boat" asks for an attribute, not a selection
+                return None
+            continue
+        if word in ("top", "bottom") and (
+            following.isdigit() or following in NUMBER_WORDS or following in SUPERLATIVES
+        ):
+            # "top 3 largest" ranks rather than naming a position
+            return None
+        if word in COLOR_CATEGORIES:
+            if word not in plan.colors:
+                plan.colors.append(word)
+        elif word in POSITIONS:
+            if POSITIONS[word] not in plan.positions:
+                plan.positions.append(POSITIONS[word])
+        elif word in SIZES:
+            if plan.size not in (None, SIZES[word]):
+                return None
+            plan.size = SIZES[word]
+        elif word in SUPERLATIVES:
+            if plan.order not in (None, SUPERLATIVES[word]):
+                return None
+            plan.order = SUPERLATIVES[word]
+        elif word.isdigit() or word in NUMBER_WORDS:
+            if plan.limit is not None:
+                return None
+            plan.limit = int(word) if word.isdigit() else NUMBER_WORDS[word]
+        elif any(form in classes for form in _singular(word)):
+            name = next(classes[form] for form in _singular(word) if form in classes)
+            if name not in plan.classes:
+                plan.classes.append(name)
+        elif word not in FILLER_WORDS:
+            return None
+
+    if plan.limit is not None and plan.order is None:
+        # "show 3 red ships" has no rule for picking which three
+        return None
+    if "left" in plan.positions and "right" in plan.positions:
+        return None
+    if "top" in plan.positions and "bottom" in plan.positions:
+        return None
+    return plan
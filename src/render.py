@@ -0,0 +1,33 @@
+import base64
+
+import cv2
+import numpy as np
+
+IMAGE_FORMATS = {"png": ".png", "jpeg": ".jpg", "jpg": ".jpg", "webp": ".webp"}
+RESPONSE_MODES = ("image", "boxes")
+OUTLINE_COLOR = (0, 0, 255)  # red, BGR
+
+
+def draw_boxes(image_bgr, boxes, color=OUTLINE_COLOR, thickness=2):
+    """Copy of ``image_bgr`` with the outlines of all ``xyxy`` boxes drawn in one ``cv2.polylines`` call."""
+    highlighted = image_bgr.copy()
+    boxes = np.asarray(boxes, dtype=np.int32).reshape(-1, 4)
+    if len(boxes):
+        # Corners (x0, y0), (x1, y0), (x1, y1), (x0, y1) of each box
+        outlines = boxes[:, [0, 1, 2, 1, 2, 3, 0, 3]].reshape(-1, 4, 2)
+        cv2.polylines(highlighted, list(outlines), True, color, thickness)
+    return highlighted
+
+
+def encode_image(image_bgr, image_format="png", quality=None):
+    """Encode to ``png``, ``jpeg`` or ``webp``; ``quality`` (1-100) applies to the lossy formats."""
+    extension = IMAGE_FORMATS[image_format]
+    params = []
+    if quality is not None and extension == ".jpg":
+        params = [cv2.IMWRITE_JPEG_QUALITY, int(quality)]
+    elif quality is not None and extension == ".webp":
+        params = [cv2.IMWRITE_WEBP_QUALITY, int(quality)]
+    ok, buffer = cv2.imencode(extension, image_bgr, params)
+    if not ok:
+        raise ValueError(f"Could not encode the image as {image_format}")
+    return base64.b64encode(buffer.tobytes()).decode("utf-8")
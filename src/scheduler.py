@@ -0,0 +1,125 @@
+import math
+import os
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+INFERENCE_CONCURRENCY = int(os.getenv("INFERENCE_CONCURRENCY", "2"))
+INFERENCE_QUEUE_SIZE = int(os.getenv("INFERENCE_QUEUE_SIZE", "8"))
+INFERENCE_QUEUE_TIMEOUT = float(os.getenv("INFERENCE_QUEUE_TIMEOUT", "30"))
+
+
+class Overloaded(RuntimeError):
+    """The request was not admitted; ``retry_after`` is a suggested wait in seconds."""
+
+    def __init__(self, message, retry_after):
+        super().__init__(message)
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class QueueFull(Overloaded):
+    pass
+
+
+class QueueTimeout(Overloaded, TimeoutError):
+    pass
+
+
+class AdmissionController:
+    """Bounds concurrent inferences and the number of requests waiting for one.
+
+    At most ``max_in_flight`` requests run at once and up to ``max_queue``
+    more wait in FIFO order. A request arriving to a full queue is refused
+    immediately with ``QueueFull``; one that waits longer than
+    ``queue_timeout`` seconds gets ``QueueTimeout``. Both carry a retry
+    estimate derived from the mean service time of recent requests.
+    """
+
+    def __init__(self, max_in_flight=INFERENCE_CONCURRENCY, max_queue=INFERENCE_QUEUE_SIZE,
+                 queue_timeout=INFERENCE_QUEUE_TIMEOUT):
+        self.max_in_flight = max_in_flight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self._condition = threading.Condition()
+        self._waiting = deque()
+        self._in_flight = 0
+        self._stats = {
+            "admitted": 0,
+            "rejected": 0,
+            "timed_out": 0,
+            "completed": 0,
+            "wait_total": 0.0,
+            "wait_max": 0.0,
+            "service_total": 0.0,
+        }
+
+    def _mean_service(self):
+        completed = self._stats["completed"]
+        return self._stats["service_total"] / completed if completed else 1.0
+
+    def _retry_after(self, position):
+        # Time for the requests ahead (and those running) to drain through the slots
+        return self._mean_service() * (position + self.max_in_flight) / self.max_in_flight
+
+    def _acquire(self):
+        ticket = object()
+        queued = time.monotonic()
+        with self._condition:
+            if self._in_flight >= self.max_in_flight or self._waiting:
+                if len(self._waiting) >= self.max_queue:
+                    self._stats["rejected"] += 1
+                    raise QueueFull("Server busy, the request queue is full", self._retry_after(len(self._waiting)))
+                self._waiting.append(ticket)
+                deadline = queued + self.queue_timeout
+                while self._waiting[0] is not ticket or self._in_flight >= self.max_in_flight:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        self._waiting.remove(ticket)
+                        self._condition.notify_all()
+                        self._stats["timed_out"] += 1
+                        raise QueueTimeout("Server busy, timed out waiting in the request queue",
+                                           self._retry_after(len(self._waiting)))
+                    self._condition.wait(remaining)
+                self._waiting.popleft()
+                self._condition.notify_all()
+            self._in_flight += 1
+            wait = time.monotonic() - queued
+            self._stats["admitted"] += 1
+            self._stats["wait_total"] += wait
+            self._stats["wait_max"] = max(self._stats["wait_max"], wait)
+
+    def _release(self, started):
+        with self._condition:
+            self._in_flight -= 1
+            self._stats["completed"] += 1
+            self._stats["service_total"] += time.monotonic() - started
+            self._condition.notify_all()
+
+    @contextmanager
+    def admit(self):
+        """Wait for an inference slot; raises ``QueueFull`` or ``QueueTimeout`` when overloaded."""
+        self._acquire()
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release(started)
+
+    def stats(self):
+        with self._condition:
+            stats = dict(self._stats)
+            in_flight, queue_depth = self._in_flight, len(self._waiting)
+        admitted, completed = stats["admitted"], stats["completed"]
+        return {
+            "in_flight": in_flight,
+            "queue_depth": queue_depth,
+            "max_in_flight": self.max_in_flight,
+            "max_queue": self.max_queue,
+            "admitted": admitted,
+            "rejected": stats["rejected"],
+            "timed_out": stats["timed_out"],
+            "mean_wait_ms": 1000 * stats["wait_total"] / admitted if admitted else 0.0,
+            "max_wait_ms": 1000 * stats["wait_max"],
+            "mean_service_ms": 1000 * stats["service_total"] / completed if completed else 0.0,
+        }
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+from color_engine import COLORS, OTHER
+
+BOX_COLUMNS = ["x_min", "y_min", "x_max", "y_max"]
+COLOR_CATEGORIES = COLORS + [OTHER]
+
+
+def build_segment_table(boxes, image_shape, colors, classes=None, class_names=None):
+    """Columnar feature table for ``xyxy`` boxes, one row per detection.
+
+    Bounds are truncated to whole pixels as before; ``mean_x`` / ``mean_y``
+    are the box centres from the raw coordinates. Numeric columns are float32;
+    ``color`` and, when ``classes`` is given, ``class`` (with ``class_names``
+    as categories) are categorical.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    image_height, image_width = image_shape[:2]
+
+    x_min, y_min, x_max, y_max = np.trunc(boxes).T
+    width = x_max - x_min
+    height = y_max - y_min
+    area = width * height
+
+    columns = {
+        "x_min": x_min,
+        "y_min": y_min,
+        "x_max": x_max,
+        "y_max": y_max,
+        "mean_x": (boxes[:, 0] + boxes[:, 2]) / 2,
+        "mean_y": (boxes[:, 1] + boxes[:, 3]) / 2,
+        "area": area,
+        "relative_area": area / (image_width * image_height),
+        "relative_height": height / image_height,
+        "relative_width": width / image_width,
+    }
+    df = pd.DataFrame({name: values.astype(np.float32) for name, values in columns.items()})
+    df.insert(6, "color", pd.Categorical(colors, categories=COLOR_CATEGORIES))
+    if classes is not None:
+        df.insert(0, "class", pd.Categorical(classes, categories=class_names))
+    return df
+
+
+def segment_boxes(df):
+    """``(N, 4)`` int array of ``xyxy`` boxes for the rows of ``df``."""
+    return df[BOX_COLUMNS].to_numpy(dtype=np.int64)
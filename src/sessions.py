@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+import uuid
+
+import numpy as np
+import pandas as pd
+
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "600"))
+SESSION_MEMORY_MB = float(os.getenv("SESSION_MEMORY_MB", "1024"))
+
+
+def _nbytes(value):
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return getattr(value, "nbytes", 0)
+
+
+def memoize(session, key, build, *args):
+    """``build(*args)``, computed once per ``session`` when one is given."""
+    if session is None:
+        return build(*args)
+    return session.get_or_compute(key, lambda: build(*args))
+
+
+class ImageSession:
+    """One registered image and the work already done on it.
+
+    ``image`` is the decoded RGB array; ``get_or_compute`` memoizes derived
+    values (color index, detections per prompt, segment tables) so follow-up
+    questions skip decoding, LangSAM and feature extraction.
+    """
+
+    def __init__(self, image):
+        self.image = image
+        self.last_used = time.monotonic()
+        self._values = {}
+        self._locks = {}
+        self._lock = threading.Lock()
+
+    def get_or_compute(self, key, build):
+        with self._lock:
+            lock = self._locks.setdefault(key, threading.Lock())
+        # Held while building, so concurrent questions on one image share a single run per key
+        with lock:
+            if key not in self._values:
+                self._values[key] = build()
+            return self._values[key]
+
+    @property
+    def nbytes(self):
+        return self.image.nbytes + sum(_nbytes(value) for value in list(self._values.values()))
+
+
+class SessionStore:
+    """Sessions by ``image_id``, dropped after ``ttl`` seconds idle or, least
+    recently used first, once together they hold more than ``max_bytes``."""
+
+    def __init__(self, ttl=SESSION_TTL_SECONDS, max_bytes=int(SESSION_MEMORY_MB * 1024 * 1024)):
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._sessions = {}
+        self._lock = threading.Lock()
+        self._stats = {"created": 0, "hits": 0, "misses": 0, "expired": 0, "evicted": 0}
+
+    def create(self, image):
+        image_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[image_id] = ImageSession(image)
+            self._stats["created"] += 1
+            self._evict(keep=image_id)
+        return image_id
+
+    def get(self, image_id):
+        """The live session for ``image_id`` (its idle timer restarted), or ``None``."""
+        with self._lock:
+            self._evict()
+            session = self._sessions.get(image_id)
+            if session is None:
+                self._stats["misses"] += 1
+                return None
+            session.last_used = time.monotonic()
+            self._stats["hits"] += 1
+            return session
+
+    def delete(self, image_id):
+        with self._lock:
+            return self._sessions.pop(image_id, None) is not None
+
+    def trim(self):
+        """Apply the memory cap again after sessions have grown."""
+        with self._lock:
+            self._evict()
+
+    def _evict(self, keep=None):
+        now = time.monotonic()
+        for image_id, session in list(self._sessions.items()):
+            if now - session.last_used > self.ttl:
+                del self._sessions[image_id]
+                self._stats["expired"] += 1
+
+        sizes = {image_id: session.nbytes for image_id, session in self._sessions.items()}
+        total = sum(sizes.values())
+        for image_id in sorted(self._sessions, key=lambda i: self._sessions[i].last_used):
+            if total <= self.max_bytes:
+                break
+            if image_id == keep:
+                continue
+            del self._sessions[image_id]
+            total -= sizes[image_id]
+            self._stats["evicted"] += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                **self._stats,
+                "active": len(self._sessions),
+                "memory_mb": round(sum(s.nbytes for s in self._sessions.values()) / 1024 / 1024, 1),
+            }
@@ -0,0 +1,112 @@
+import os
+import re
+
+import numpy as np
+
+from audio import TARGET_SR
+
+STREAM_WINDOW_SECONDS = float(os.getenv("STREAM_WINDOW_SECONDS", "8"))
+STREAM_OVERLAP_SECONDS = float(os.getenv("STREAM_OVERLAP_SECONDS", "1"))
+STREAM_STEP_SECONDS = float(os.getenv("STREAM_STEP_SECONDS", "1"))
+
+
+def pcm16_to_float(chunk):
+    """Little-endian 16-bit PCM bytes to float32 samples in [-1, 1)."""
+    return np.frombuffer(chunk, dtype="<i2").astype(np.float32) / 32768.0
+
+
+def _normalize_word(word):
+    return re.sub(r"[^\w']", "", word.lower())
+
+
+def merge_overlap(text, continuation, max_words=8):
+    """Append ``continuation`` to ``text``, dropping the words both windows heard.
+
+    Consecutive windows share ``STREAM_OVERLAP_SECONDS`` of audio, so the
+    start of the later transcript usually repeats the end of the earlier one;
+    the longest run of up to ``max_words`` matching words is removed once.
+    """
+    words, new_words = text.split(), continuation.split()
+    for k in range(min(max_words, len(words), len(new_words)), 0, -1):
+        if [_normalize_word(w) for w in words[-k:]] == [_normalize_word(w) for w in new_words[:k]]:
+            new_words = new_words[k:]
+            break
+    return " ".join(words + new_words)
+
+
+class StreamingTranscription:
+    """Incremental transcription of one audio stream in overlapping windows.
+
+    Audio is fed as 16 kHz mono float samples while the user speaks. Every
+    ``step`` seconds of new audio the open window is transcribed for a
+    partial result; once it reaches ``window`` seconds its text is committed
+    and the next window starts ``overlap`` seconds before its end, so words
+    cut at the boundary are heard whole by one of the two windows.
+    ``transcriber`` is the shared ``TranscriptionService``, so windows of
+    concurrent streams are batched together with regular uploads.
+    """
+
+    def __init__(self, transcriber, window=STREAM_WINDOW_SECONDS, overlap=STREAM_OVERLAP_SECONDS,
+                 step=STREAM_STEP_SECONDS):
+        if not 0 <= overlap < window:
+            raise ValueError("overlap must be shorter than the window")
+        self.transcriber = transcriber
+        self.window = int(window * TARGET_SR)
+        self.overlap = int(overlap * TARGET_SR)
+        self.step = int(step * TARGET_SR)
+        self.committed = ""
+        self._audio = np.zeros(0, dtype=np.float32)  # samples from the start of the open window
+        self._window_id = 0
+        self._transcribed = 0  # samples of the open window covered by the last partial
+        self._commits = []  # futures of full windows, in order
+        self._partial = None  # (window_id, future) of the open window
+        self._partial_text = ""
+
+    def feed(self, samples):
+        self._audio = np.concatenate([self._audio, samples])
+        while len(self._audio) >= self.window:
+            self._commits.append(self.transcriber.submit(self._audio[:self.window]))
+            self._audio = self._audio[self.window - self.overlap:]
+            self._window_id += 1
+            self._transcribed = 0
+            self._partial_text = ""
+        if self._partial is None and len(self._audio) - self._transcribed >= self.step:
+            self._transcribed = len(self._audio)
+            self._partial = (self._window_id, self.transcriber.submit(self._audio))
+
+    def poll(self):
+        """Collect finished transcriptions; returns the new partial text, or ``None`` if unchanged."""
+        changed = False
+        while self._commits and self._commits[0].done():
+            self.committed = merge_overlap(self.committed, self._commits.pop(0).result())
+            changed = True
+        if self._partial is not None and self._partial[1].done():
+            window_id, future = self._partial
+            self._partial = None
+            if window_id == self._window_id:
+                self._partial_text = future.result()
+                changed = True
+        if not changed:
+            return None
+        return merge_overlap(self.committed, self._partial_text) if not self._commits else self.committed
+
+    def finish(self, timeout=None):
+        """Transcribe the rest of the open window and return the full text."""
+        covered = self._transcribed == len(self._audio)
+        if covered and self._partial is not None and self._partial[0] == self._window_id:
+            tail = self._partial[1]  # the partial in flight already hears all of it
+        elif covered and self._partial_text:
+            tail = None
+        elif len(self._audio):
+            tail = self.transcriber.submit(self._audio)
+            self._partial_text = ""
+        else:
+            tail = None
+        for future in self._commits:
+            self.committed = merge_overlap(self.committed, future.result(timeout))
+        self._commits = []
+        if tail is not None:
+            self._partial_text = tail.result(timeout)
+        self.committed = merge_overlap(self.committed, self._partial_text)
+        self._partial, self._partial_text = None, ""
+        return self.committed.strip()
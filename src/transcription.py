@@ -0,0 +1,115 @@
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+from audio import TARGET_SR
+from model_registry import registry
+
+WHISPER_MAX_BATCH_SIZE = int(os.getenv("WHISPER_MAX_BATCH_SIZE", "8"))
+WHISPER_MAX_WAIT_MS = float(os.getenv("WHISPER_MAX_WAIT_MS", "20"))
+
+
+class TranscriptionService:
+    """Groups concurrent Whisper requests into batches.
+
+    Requests are queued; a worker thread takes the first waiting clip, keeps
+    collecting until ``max_batch_size`` clips are queued or ``max_wait_ms``
+    has passed, runs one batched pipeline call and resolves each request's
+    future with its own text.
+    """
+
+    def __init__(self, max_batch_size=WHISPER_MAX_BATCH_SIZE, max_wait_ms=WHISPER_MAX_WAIT_MS, model_name=None):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000
+        self.model_name = model_name
+        self._queue = queue.Queue()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self._stats = {
+            "requests": 0,
+            "batches": 0,
+            "failed_batches": 0,
+            "audio_seconds": 0.0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "inference_total": 0.0,
+        }
+
+    def submit(self, audio):
+        """Queue 16 kHz mono float audio; returns a future resolving to the text."""
+        future = Future()
+        self._queue.put((audio, future, time.monotonic()))
+        with self._lock:
+            if self._worker is None:
+                self._worker = threading.Thread(target=self._run, name="whisper-batcher", daemon=True)
+                self._worker.start()
+        return future
+
+    def transcribe(self, audio, timeout=None):
+        return self.submit(audio).result(timeout)
+
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect()
+            started = time.monotonic()
+            inputs = [{"raw": audio, "sampling_rate": TARGET_SR} for audio, _, _ in batch]
+            try:
+                with registry.whisper(self.model_name) as whisper_model:
+                    outputs = whisper_model(inputs, batch_size=len(inputs))
+            except Exception as e:
+                for _, future, _ in batch:
+                    future.set_exception(e)
+                with self._lock:
+                    self._stats["failed_batches"] += 1
+                continue
+            finished = time.monotonic()
+
+            for (_, future, _), output in zip(batch, outputs):
+                future.set_result(output["text"])
+
+            with self._lock:
+                stats = self._stats
+                stats["requests"] += len(batch)
+                stats["batches"] += 1
+                stats["inference_total"] += finished - started
+                for audio, _, queued in batch:
+                    wait = started - queued
+                    stats["queue_wait_total"] += wait
+                    stats["queue_wait_max"] = max(stats["queue_wait_max"], wait)
+                    stats["audio_seconds"] += len(audio) / TARGET_SR
+
+    def stats(self):
+        with self._lock:
+            stats = dict(self._stats)
+        requests, batches = stats["requests"], stats["batches"]
+        uptime = time.monotonic() - self._started
+        return {
+            "requests": requests,
+            "batches": batches,
+            "failed_batches": stats["failed_batches"],
+            "queue_depth": self._queue.qsize(),
+            "mean_batch_size": requests / batches if batches else 0.0,
+            "mean_queue_wait_ms": 1000 * stats["queue_wait_total"] / requests if requests else 0.0,
+            "max_queue_wait_ms": 1000 * stats["queue_wait_max"],
+            "mean_batch_inference_ms": 1000 * stats["inference_total"] / batches if batches else 0.0,
+            "requests_per_second": requests / uptime if uptime else 0.0,
+            "audio_seconds_per_inference_second": (
+                stats["audio_seconds"] / stats["inference_total"] if stats["inference_total"] else 0.0
+            ),
+        }